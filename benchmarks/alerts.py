@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Measures alert matching over a flushed block of log lines, searching each
+# line for every rule versus the combined expression of AlertRules.
+#
+# usage: python benchmarks/alerts.py [number_of_rules] [number_of_lines]
+
+import sys, time
+from fish_slapping import AlertRule, AlertRules
+
+def per_rule(rules, lines):
+    matches = {}
+    for line in lines.split('\n'):
+        for rule in rules:
+            if rule.regex.search(line):
+                matches[rule] = line
+    return matches
+
+def make_lines(count):
+    lines = []
+    for i in range(count):
+        message = 'Synthetic line number %d' % i
+        if i % 5000 == 0:
+            message = 'Synthetic failure code %d' % (i / 5000)
+        lines.append('2011-09-21 01:%02d:%02d,%03d - bench - INFO - %s' %
+                     (i / 60000 % 60, i / 1000 % 60, i % 1000, message))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rules = [ AlertRule('rule%d' % i, 'failure code %d$' % i) for i in range(count) ]
+    text = make_lines(lines)
+
+    print('%d rules, %d lines' % (count, lines))
+    start = time.time()
+    old = per_rule(rules, text)
+    old_time = time.time() - start
+    print('per rule: %.3fs' % old_time)
+
+    alert_rules = AlertRules(rules)
+    alert_rules.combined
+    start = time.time()
+    new = alert_rules.match(text)
+    new_time = time.time() - start
+    print('combined: %.3fs (%.1fx)' % (new_time, old_time / new_time))
+    assert old == new
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compares the LineBuffer that Log reads into against the former string
+# buffer, that new data was concatenated to and partitioned on every flush.
+# Each one runs in its own process, so that peak memory can be compared.
+# Logs keep their recent lines in a History, as they do by default, and the
+# bytearray buffer is also run without it, to see what keeping them costs.
+#
+# usage: python benchmarks/buffer.py [number_of_lines]
+
+import sys, os, time, resource, subprocess
+from fish_slapping import Log
+
+class StringBuffer(object):
+    """
+    The former buffer: a string new data is concatenated to
+    """
+
+    def __init__(self):
+        self.data = ''
+
+    def __len__(self):
+        return len(self.data)
+
+    def readinto(self, fileobj, size):
+        self.data += fileobj.read(size)
+
+    def append(self, data):
+        self.data += str(data)
+
+    def has_lines(self, count = 1):
+        return self.data.count('\n') >= count
+
+    def shrink(self):
+        pass
+
+    def terminate(self):
+        if self.data and not self.data.endswith('\n'):
+            self.data += '\n'
+
+    def pop_lines(self, max_lines = None):
+        message, br, self.data = self.data.rpartition('\n')
+        return message
+
+def make_log(filename, lines):
+    logfile = open(filename, 'w')
+    for i in range(lines):
+        logfile.write('2011-09-21 01:%02d:%02d,%03d - bench - DEBUG - Synthetic line number %d\n' %
+                      (i / 60000 % 60, i / 1000 % 60, i % 1000, i))
+    logfile.close()
+
+def bench(variant, filename):
+    log = Log(filename, recent_lines=0 if variant == 'no-history' else None)
+    if variant == 'string':
+        log.buffer = StringBuffer()
+    log.openfile()
+    start = time.time()
+    size = 0
+    # Bursts of 16MiB, which end in the middle of a line
+    while True:
+        size += len(log.flush(max_bytes=16 * 1024 * 1024))
+        if not log.dirty:
+            break
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%-10s %.3fs, %.1f MB/s, peak memory %d KB' %
+          (variant, elapsed, size / elapsed / 1024 / 1024, peak))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        bench(sys.argv[2], sys.argv[1])
+        sys.exit(0)
+
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    filename = '/tmp/fish-slapping-bench-buffer.log'
+    make_log(filename, lines)
+    print('%d lines, %d bytes' % (lines, os.path.getsize(filename)))
+    for variant in ('string', 'bytearray', 'no-history'):
+        subprocess.check_call([sys.executable, __file__, filename, variant])
+    os.remove(filename)
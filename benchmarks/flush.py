@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Measures Log.flush throughput on a chatty debug log, with and without the
+# level prefilter that only parses the last ERROR and INFO entries.
+#
+# usage: python benchmarks/flush.py [number_of_lines]
+
+import sys, os, time
+from fish_slapping import Log
+
+class FullParseLog(Log):
+    PREFILTER = False
+
+def make_log(filename, lines):
+    logfile = open(filename, 'w')
+    for i in range(lines):
+        level = 'DEBUG'
+        if i % 1000 == 0:
+            level = 'ERROR'
+        elif i % 100 == 0:
+            level = 'INFO'
+        logfile.write('2011-09-21 01:%02d:%02d,%03d - bench - %s - Synthetic line number %d\n' %
+                      (i / 60000 % 60, i / 1000 % 60, i % 1000, level, i))
+    logfile.close()
+
+def bench(cls, filename):
+    log = cls(filename)
+    log.openfile()
+    start = time.time()
+    log.flush()
+    return time.time() - start, log
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    filename = '/tmp/fish-slapping-bench-flush.log'
+    make_log(filename, lines)
+
+    print('%d lines, %d bytes' % (lines, os.path.getsize(filename)))
+    old, old_log = bench(FullParseLog, filename)
+    print('full parse: %.3fs, %d lines/s' % (old, lines / old))
+    new, new_log = bench(Log, filename)
+    print('prefilter:  %.3fs, %d lines/s (%.1fx)' % (new, lines / new, old / new))
+    assert old_log.status.message == new_log.status.message
+    assert old_log._error.message == new_log._error.message
+
+    os.remove(filename)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compares the memory taken by each record kept by the bot: Status and
+# Error objects and stream sessions, as they were with a __dict__ per
+# object, and as they are now.
+# Strings are left out, since they are the same either way.
+#
+# usage: python benchmarks/memory.py
+
+import sys, datetime
+from fish_slapping import Status, Error, StreamSession
+
+class DictStatus(object):
+    def __init__(self, msg, tstamp = None, show = ''):
+        self.message = msg
+        self.tstamp = tstamp
+        self.show = show
+
+class DictError(DictStatus):
+    def __init__(self, msg, tstamp = None, error_timeout=3600):
+        super(DictError, self).__init__(msg, tstamp, 'dnd')
+        self.error_timeout = error_timeout
+
+class DictStreamSession(object):
+    def __init__(self, *args, **kwargs):
+        session = StreamSession(*args, **kwargs)
+        for name in StreamSession.__slots__:
+            setattr(self, name, getattr(session, name))
+
+def size(obj, times = ()):
+    """
+    Bytes of obj, its __dict__ if it has one and the times it refers to
+    """
+    total = sys.getsizeof(obj)
+    if type(obj).__dictoffset__:
+        total += sys.getsizeof(obj.__dict__)
+    for value in times:
+        total += sys.getsizeof(value)
+    return total
+
+def compare(name, before, after):
+    print('%-14s %4d bytes -> %4d bytes (%.0f%%)' % (name, before, after,
+                                                    100.0 * (before - after) / before))
+
+if __name__ == '__main__':
+    tstamp = datetime.datetime(2011, 9, 21, 1, 0, 1)
+    compare('Status', size(DictStatus('message', tstamp), [ tstamp ]),
+            size(Status('message', tstamp), [ tstamp ]))
+    compare('Error', size(DictError('message', tstamp), [ tstamp ]),
+            size(Error('message', tstamp), [ tstamp ]))
+    session = StreamSession('user@server', timeout=60, max_lines=10)
+    compare('StreamSession',
+            size(DictStreamSession('user@server', timeout=60, max_lines=10),
+                 [ session.start, session.deadline, session.refilled, session.last_summary ]),
+            size(session, [ session.start, session.deadline, session.refilled, session.last_summary ]))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Measures how many lines per second Log.parse_line handles for the default
+# format, against the former implementation based on strptime.
+#
+# usage: python benchmarks/parse_line.py [number_of_lines]
+
+import sys, time, datetime
+from fish_slapping import Log
+
+class StrptimeLog(Log):
+    """
+    Log.parse_line as it was before the fixed offset parser
+    """
+
+    def parse_line(self, line):
+        dtime, name, msgtype, msg = line.split(' - ')
+        tstamp = datetime.datetime.strptime(dtime.split(',')[0], '%Y-%m-%d %H:%M:%S')
+        return tstamp, msgtype, msg
+
+def make_lines(lines):
+    # A burst of 1000 lines per second
+    start = datetime.datetime(2011, 9, 21, 1, 0, 0)
+    result = []
+    for i in range(lines):
+        tstamp = start + datetime.timedelta(0, i / 1000)
+        result.append('%s,%03d - bench - INFO - Synthetic line number %d' %
+                      (tstamp.strftime('%Y-%m-%d %H:%M:%S'), i % 1000, i))
+    return result
+
+def bench(cls, lines):
+    log = cls('/tmp/fish-slapping-bench-parse-line.log')
+    start = time.time()
+    parsed = [ log.parse_line(line) for line in lines ]
+    return len(lines) / (time.time() - start), parsed
+
+if __name__ == '__main__':
+    lines = make_lines(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+
+    old, old_parsed = bench(StrptimeLog, lines)
+    print('strptime:     %d lines/s' % old)
+    new, new_parsed = bench(Log, lines)
+    print('fixed offset: %d lines/s (%.1fx)' % (new, new / old))
+    assert old_parsed == new_parsed
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compares the time a Log takes to rewind by error_timeout on startup,
+# using the binary search and the block based backward scanner against the
+# former implementation, which did one seek and one byte read per character.
+# Then compares rewinding by lines with the scanner and with the ring of
+# line offsets kept by flush.
+#
+# usage: python benchmarks/rewind.py [number_of_lines]
+
+import sys, os, time, datetime
+from fish_slapping import Log, MappedLog
+
+class ByteLog(Log):
+    """
+    Log.rewind as it was before the block based scanner
+    """
+
+    def _char_at(self, pos):
+        self.log.seek(pos)
+        return self.log.read(1)
+
+    def _rewind_one_line(self):
+        pos = self.pointer - 2
+        while pos > 0 and self._char_at(pos) != '\n':
+            pos -= 1
+        if pos > 0:
+            pos += 1
+        self.log.seek(pos)
+
+    def rewind(self, lines = None, dtime = None):
+        if dtime:
+            timelimit = datetime.datetime.now() - datetime.timedelta(0, dtime)
+            tstamp = datetime.datetime.now()
+        size = self.real_size
+        if size == 0:
+            return
+        self.log.seek(size)
+        if lines is None and dtime is None:
+            return
+        i = 0
+        non_log_lines = [0]
+        while self.pointer > 0 and (lines is None or i < lines) and (dtime is None or tstamp > timelimit):
+            self._rewind_one_line()
+            position = self.pointer
+            line = self.log.readline()
+            self.log.seek(position)
+            try:
+                tstamp = self.parse_line(line)[0]
+            except ValueError:
+                non_log_lines[-1] += 1
+                continue
+            non_log_lines.append(0)
+            i += 1
+        if self.pointer > 0 and dtime:
+            self.log.readline()
+            if len(non_log_lines) > 1:
+                for i in range(0, non_log_lines[-2]):
+                    self.log.readline()
+
+class ScanLog(Log):
+    SORTED = False
+
+class ScanMappedLog(MappedLog):
+    SORTED = False
+
+def make_log(filename, lines):
+    # Lines are spread over the last two hours, so that the default
+    # error timeout covers half of the file. No lines are written in
+    # the minutes around the start of the window, so that it won't move
+    # while the benchmark runs.
+    now = datetime.datetime.now()
+    step = 7200.0 / lines
+    logfile = open(filename, 'w')
+    for i in range(lines):
+        age = 7200 - i * step
+        if abs(age - 3600) < 300:
+            continue
+        tstamp = now - datetime.timedelta(0, age)
+        logfile.write('%s,000 - bench - INFO - Synthetic line number %d\n' %
+                      (tstamp.strftime('%Y-%m-%d %H:%M:%S'), i))
+        if i % 10 == 0:
+            logfile.write('a continuation line of a multi-lined entry\n')
+    logfile.close()
+
+def bench(cls, filename):
+    log = cls(filename)
+    start = time.time()
+    log.rewind(dtime=log.error_timeout)
+    return time.time() - start, log.pointer
+
+def bench_lines(filename, lines, line_offsets = None):
+    log = Log(filename, line_offsets=line_offsets)
+    log.rewind(lines)
+    log.flush()
+    start = time.time()
+    for i in range(100):
+        log.rewind(lines)
+    return (time.time() - start) / 100, log.pointer
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    filename = '/tmp/fish-slapping-bench-rewind.log'
+    make_log(filename, lines)
+
+    print('%d lines, %d bytes' % (lines, os.path.getsize(filename)))
+    old, old_pointer = bench(ByteLog, filename)
+    print('byte at a time: %.3fs' % old)
+    scan, scan_pointer = bench(ScanLog, filename)
+    print('block scanner:  %.3fs (%.1fx)' % (scan, old / scan))
+    mapped, mapped_pointer = bench(ScanMappedLog, filename)
+    print('mapped scanner: %.3fs (%.1fx)' % (mapped, old / mapped))
+    new, new_pointer = bench(Log, filename)
+    print('binary search:  %.3fs (%.1fx)' % (new, old / new))
+    assert old_pointer == scan_pointer == mapped_pointer == new_pointer
+
+    count = 5000
+    scan, scan_pointer = bench_lines(filename, count)
+    print('%d lines, scanner:      %.5fs' % (count, scan))
+    ring, ring_pointer = bench_lines(filename, count, count)
+    print('%d lines, line offsets: %.5fs (%.1fx)' % (count, ring, scan / ring))
+    assert scan_pointer == ring_pointer
+
+    os.remove(filename)
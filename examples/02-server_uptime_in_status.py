@@ -1,12 +1,8 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from fish_slapping import Bot
-from subprocess import Popen, PIPE
-
-def uptime():
-    return '', Popen('uptime', stdout=PIPE).stdout.read()
+from fish_slapping import Bot, StatusGroup, UptimeStatus, LoadStatus
 
 bot = Bot("user@domain.com", "secret_password")
-bot.status = uptime
+bot.status = StatusGroup(UptimeStatus(), LoadStatus(away=None, dnd=None))
 bot.run()
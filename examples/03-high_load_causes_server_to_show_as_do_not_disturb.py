@@ -1,22 +1,10 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from fish_slapping import Bot
-from subprocess import Popen, PIPE
+from fish_slapping import Bot, LoadStatus
 
-def uptime():
-    # This gets the output of the "uptime" system command
-    uptime = Popen('uptime', stdout=PIPE).stdout.read()
-
-    # This parses the uptime to get just the instant load
-    load = float(uptime.split(':')[-1].split(',')[0].strip())
-
-    if load > 4:
-        return 'dnd', uptime
-    if load > 2:
-        return 'away', uptime
-    return '', uptime
-    
+# Shows as away when the load of the last minute is over 2, and as
+# do not disturb when it's over 4. The load is read every 10 seconds.
 bot = Bot("user@domain.com", "secret_password")
-bot.status = uptime
+bot.status = LoadStatus(interval=10, away=2, dnd=4)
 bot.run()
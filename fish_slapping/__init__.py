@@ -16,12 +16,25 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import xmpp, time, os, subprocess, datetime, logging
+import xmpp, time, os, re, subprocess, datetime, logging, mmap, heapq, itertools, calendar
+from collections import OrderedDict, deque, namedtuple
+from fish_slapping.watcher import get_watcher, PollingWatcher, InotifyWatcher
+from fish_slapping.checkpoint import CheckpointStore
+from fish_slapping.scheduler import Scheduler, ThreadPool
+from fish_slapping.outbox import Outbox
+from fish_slapping.alerts import AlertRule, AlertRules
+from fish_slapping.index import TimeIndex
+from fish_slapping.history import History
+from fish_slapping.errors import ErrorIndex, Logs
+from fish_slapping.status import (SHOW_PRIORITY, StatusProvider, CachedStatus, StatusGroup,
+                                  LoadStatus, MemoryStatus, UptimeStatus)
 
 class Finish(Exception):
     pass
 
 class Status(object):
+    __slots__ = ('message', 'tstamp', 'show')
+
     def __init__(self, msg, tstamp = None, show = ''):
         if tstamp is None:
             tstamp = datetime.datetime.now()
@@ -34,94 +47,463 @@ class Status(object):
         return self.tstamp.strftime("%Y-%m-%d %H:%M:%S")
 
 class Error(Status):
+    __slots__ = ('error_timeout',)
+
     def __init__(self, msg, tstamp = None, error_timeout=3600):
         super(Error, self).__init__(msg, tstamp, 'dnd')
         self.error_timeout = error_timeout
         
     @property
     def expired(self):
-        return (datetime.datetime.now() - self.tstamp).seconds > self.error_timeout
+        return (datetime.datetime.now() - self.tstamp).total_seconds() > self.error_timeout
+
+class Alert(Error):
+    """
+    A log line that matched an AlertRule
+    """
+    __slots__ = ('rule',)
+
+    def __init__(self, msg, tstamp, rule):
+        super(Alert, self).__init__(msg, tstamp, error_timeout=rule.timeout)
+        self.show = rule.show
+        self.rule = rule
+
+class LogRecord(namedtuple('LogRecord', 'seconds level message')):
+    """
+    A parsed log line. Log times are naive local times, so seconds is the
+    local time counted as if it were UTC, as index.TimeIndex keeps it, not
+    seconds since the epoch. Only built by Log.parse_record, lines read by
+    a Log are kept as text.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_line(cls, tstamp, level, message):
+        return cls(calendar.timegm(tstamp.timetuple()), level, message)
+
+    @property
+    def tstamp(self):
+        return datetime.datetime.utcfromtimestamp(self.seconds)
+
+
+# Priority of log levels, for filtering streams by level
+LEVELS = { 'DEBUG': 10, 'INFO': 20, 'WARN': 30, 'WARNING': 30,
+           'ERROR': 40, 'CRITICAL': 50, 'FATAL': 50 }
+
+class StreamSession(object):
+
+    # Seconds between messages telling how many lines were suppressed
+    SUMMARY_INTERVAL = 10
 
+    __slots__ = ('jid', 'timeout', 'condition', 'start', 'deadline', 'closed',
+                 'max_lines', 'max_bytes', 'line_tokens', 'byte_tokens', 'refilled',
+                 'suppressed', 'last_summary', 'min_level', 'parse_level', 'pattern',
+                 'entry_matches')
 
-class StreamSession():
-    def __init__(self, jid, timeout = None, condition = None):
+    def __init__(self, jid, timeout = None, condition = None, max_lines = None, max_bytes = None,
+                 level = None, grep = None, parse_level = None):
         self.jid = jid
         self.timeout = timeout
         self.condition = condition
         self.start = datetime.datetime.now()
+        # Expired when more than timeout seconds have passed
+        self.deadline = None
+        if timeout:
+            self.deadline = self.start + datetime.timedelta(0, timeout + 1)
+        self.closed = False
+        # Lines and bytes per second, up to one second of them can be sent at once
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.line_tokens = max_lines
+        self.byte_tokens = max_bytes
+        self.refilled = self.start
+        self.suppressed = 0
+        self.last_summary = self.start
+        # Only lines of at least this level, as told by parse_level(line), and
+        # matching this regular expression are sent. Lines without a level
+        # belong to the entry before them.
+        self.min_level = None
+        if level:
+            self.min_level = LEVELS[level.upper()]
+        self.parse_level = parse_level
+        self.pattern = None
+        if grep:
+            self.pattern = re.compile(grep)
+        self.entry_matches = False
 
     @property
     def expired(self):
-        if self.timeout and (datetime.datetime.now() - self.start).seconds > self.timeout:
+        if self.deadline and datetime.datetime.now() >= self.deadline:
             return True
         if self.condition is not None and not self.condition():
             return True
         return False
 
-class StreamSessionManager(object):
+    def _refill(self, now):
+        elapsed = (now - self.refilled).total_seconds()
+        self.refilled = now
+        if self.max_lines:
+            self.line_tokens = min(self.max_lines, self.line_tokens + elapsed * self.max_lines)
+        if self.max_bytes:
+            self.byte_tokens = min(self.max_bytes, self.byte_tokens + elapsed * self.max_bytes)
 
-    def __init__(self):
-        self.sessions = []
+    def _filter(self, lines):
+        accepted = []
+        for line in lines:
+            if self.min_level:
+                level = self.parse_level(line)
+                if level is not None:
+                    self.entry_matches = LEVELS.get(level, 0) >= self.min_level
+                if not self.entry_matches:
+                    continue
+            if self.pattern and not self.pattern.search(line):
+                continue
+            accepted.append(line)
+        return accepted
+
+    def accept(self, message):
+        """
+        Returns the part of message, a block of lines, that passes the filters
+        and is within the rate limit, or None if no line is. Lines over the
+        limit are counted as suppressed.
+        """
+        lines = None
+        if self.min_level or self.pattern:
+            lines = self._filter(message.split('\n'))
+            if not lines:
+                return None
+            message = '\n'.join(lines)
+        if not self.max_lines and not self.max_bytes:
+            return message
+        self._refill(datetime.datetime.now())
+        if lines is None:
+            lines = message.split('\n')
+        for accepted, line in enumerate(lines):
+            size = len(line) + 1
+            if ((self.max_lines and self.line_tokens < 1) or
+                (self.max_bytes and self.byte_tokens < size)):
+                break
+            if self.max_lines:
+                self.line_tokens -= 1
+            if self.max_bytes:
+                self.byte_tokens -= size
+        else:
+            return message
+        # Drops the rest of the block, so that what is sent has no gaps
+        self.suppressed += len(lines) - accepted
+        if accepted:
+            return '\n'.join(lines[:accepted])
+        return None
+
+    def summary(self, force = False):
+        """
+        Returns a message telling how many lines were suppressed, if any, at
+        most every SUMMARY_INTERVAL seconds unless force is True
+        """
+        if not self.suppressed:
+            return None
+        now = datetime.datetime.now()
+        if not force and (now - self.last_summary).total_seconds() < self.SUMMARY_INTERVAL:
+            return None
+        summary = '--- %d lines suppressed' % self.suppressed
+        self.suppressed = 0
+        self.last_summary = now
+        return summary
+
+class StreamSessionManager(object):
 
-    def add(self, jid, timeout = None, condition = None):
-        self.sessions.append(StreamSession(jid, timeout, condition))
+    # Seconds between checks of session conditions, 0 checks on every expire
+    CONDITION_INTERVAL = 0
+
+    def __init__(self, condition_interval = None):
+        # Sessions of each jid, in the order jids were added
+        self.sessions = OrderedDict()
+        self._receivers = None
+        # Heap of (deadline, sequence, session) of sessions with timeout
+        self.deadlines = []
+        self.sequence = itertools.count()
+        self.conditional = []
+        if condition_interval is None:
+            condition_interval = self.CONDITION_INTERVAL
+        self.condition_interval = datetime.timedelta(0, condition_interval)
+        self.next_condition_check = None
+        # Summaries of expired sessions, not sent yet
+        self.final_summaries = []
+
+    def add(self, jid, timeout = None, condition = None, max_lines = None, max_bytes = None,
+            level = None, grep = None, parse_level = None):
+        session = StreamSession(jid, timeout, condition, max_lines, max_bytes,
+                                level, grep, parse_level)
+        if jid not in self.sessions:
+            self.sessions[jid] = []
+            self._receivers = None
+        self.sessions[jid].append(session)
+        if session.deadline:
+            heapq.heappush(self.deadlines, (session.deadline, next(self.sequence), session))
+        if condition is not None:
+            self.conditional.append(session)
+            self.next_condition_check = None
 
     @property
     def receivers(self):
-        jids = []
-        for jid in [ session.jid for session in self.sessions ]:
-            if jid not in jids:
-                jids.append(jid)
-        return jids
-        
+        if self._receivers is None:
+            self._receivers = self.sessions.keys()
+        return self._receivers
+
+    def _expired(self):
+        now = datetime.datetime.now()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            session = heapq.heappop(self.deadlines)[2]
+            if not session.closed:
+                session.closed = True
+                yield session
+
+        if self.next_condition_check is not None and now < self.next_condition_check:
+            return
+        self.next_condition_check = now + self.condition_interval
+        self.conditional = [ session for session in self.conditional if not session.closed ]
+        for session in self.conditional:
+            if not session.condition():
+                session.closed = True
+                yield session
 
     def expire(self):
+        """
+        Removes expired sessions, and returns the jids that have no sessions left
+        """
         jids = []
-        i = 0
-        while i < len(self.sessions):
-            if self.sessions[i].expired:
-                jids.append(self.sessions.pop(i).jid)
-            else:
-                i += 1
-        for jid in [ session.jid for session in self.sessions ]:
-            try:
-                jids.remove(jid)
-            except ValueError:
-                pass
+        for session in list(self._expired()):
+            summary = session.summary(force=True)
+            if summary:
+                self.final_summaries.append((session.jid, summary))
+            sessions = self.sessions[session.jid]
+            sessions.remove(session)
+            if not sessions:
+                del self.sessions[session.jid]
+                jids.append(session.jid)
+        if jids:
+            self._receivers = None
         return jids
 
+    def accept(self, jid, message):
+        """
+        Returns the part of message that can be sent to jid, according to the
+        rate limit of its most recent session
+        """
+        return self.sessions[jid][-1].accept(message)
+
+    def summaries(self):
+        """
+        Yields (jid, summary) of sessions that have suppressed lines
+        """
+        while self.final_summaries:
+            yield self.final_summaries.pop(0)
+        for jid, sessions in self.sessions.items():
+            for session in sessions:
+                summary = session.summary()
+                if summary:
+                    yield jid, summary
+
     def remove(self, jid):
-        i = 0
-        while i < len(self.sessions):
-            if self.sessions[i].jid == jid:
-                self.sessions.pop(i)
-            else:
-                i += 1
+        sessions = self.sessions.pop(jid, None)
+        if sessions is not None:
+            for session in sessions:
+                session.closed = True
+            self._receivers = None
+
+class LineBuffer(object):
+    """
+    Reusable buffer for data read from a log. Data is read straight into it,
+    and complete lines are copied out of it only once, when they're taken.
+    """
+
+    SLACK = 64 * 1024
+
+    def __init__(self, size = 64 * 1024):
+        self.size = size
+        self.data = bytearray(size)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _reserve(self, size):
+        needed = self.length + size
+        if needed > len(self.data):
+            # Buffer is reused, so some room for an incomplete line is enough
+            self.data.extend(bytearray(needed + self.SLACK - len(self.data)))
+
+    def readinto(self, fileobj, size):
+        self._reserve(size)
+        self.length += fileobj.readinto(memoryview(self.data)[self.length:self.length + size])
+
+    def append(self, data):
+        self._reserve(len(data))
+        self.data[self.length:self.length + len(data)] = data
+        self.length += len(data)
+
+    def has_lines(self, count = 1):
+        """
+        Whether there are at least count complete lines in the buffer
+        """
+        pos = -1
+        for i in range(count):
+            pos = self.data.find('\n', pos + 1, self.length)
+            if pos < 0:
+                return False
+        return True
+
+    def shrink(self):
+        """
+        Gives back what the buffer grew to hold a burst, once it's been taken out
+        """
+        if len(self.data) > self.size and self.length <= self.size:
+            data = bytearray(self.size)
+            data[:self.length] = self.data[:self.length]
+            self.data = data
+
+    def terminate(self):
+        """
+        Ends the last line, if it's incomplete
+        """
+        if self.length and self.data[self.length - 1] != ord('\n'):
+            self.append('\n')
+
+    def clear(self):
+        self.length = 0
+
+    def pop_lines(self, max_lines = None):
+        """
+        Removes up to max_lines complete lines from the buffer and returns them,
+        without the last line break.
+        """
+        if max_lines is None:
+            end = self.data.rfind('\n', 0, self.length)
+        else:
+            end = -1
+            for i in range(max_lines):
+                pos = self.data.find('\n', end + 1, self.length)
+                if pos < 0:
+                    break
+                end = pos
+        if end < 0:
+            return ''
+        lines = memoryview(self.data)[:end].tobytes()
+        rest = self.length - end - 1
+        self.data[:rest] = self.data[end + 1:self.length]
+        self.length = rest
+        return lines
 
 class Log(object):
 
     DEFAULT_ERROR_TIMEOUT = 3600
+    BLOCK_SIZE = 64 * 1024
+    # Entries are expected in chronological order, so rewinding by time can
+    # binary search the file. Set to False for logs that are not sorted.
+    SORTED = True
+    # Only the last ERROR and INFO entries of each flush matter, so flush looks
+    # for them instead of parsing every line. Only done for the default format.
+    PREFILTER = True
+    # Entries added to the TimeIndex on each flush, the rest is indexed when needed
+    INDEX_STEPS = 64
+    # Recent lines kept in memory to be shown, set to 0 to disable
+    RECENT_LINES = 1000
+    RECENT_BYTES = 256 * 1024
     
-    def __init__(self, logfile, name=None, error_timeout=None):
+    def __init__(self, logfile, name=None, error_timeout=None, checkpoint=None, alerts=None,
+                 index=None, line_offsets=None, recent_lines=None, recent_bytes=None):
         if name is None:
             self.name = os.path.basename(logfile).split('.')[0]
         else:
             self.name = name
-        self.buffer = ''
+        self.buffer = LineBuffer()
         self.log = None
+        self.inode = None
+        self._last_time = (None, None)
+        # Set by watchers when the file changes, flush is only needed if True
+        self.dirty = True
 
         self.session = StreamSessionManager()
 
         self.error_timeout = error_timeout or self.DEFAULT_ERROR_TIMEOUT
+        self.checkpoint = checkpoint
+        # AlertRules checked against every flushed line, and the last Alert of each rule
+        self.alert_rules = alerts
+        self._alerts = {}
+        # Called when the error or alerts change, see errors.ErrorIndex
+        self.error_listener = None
+        # TimeIndex to rewind by time without searching the whole file. True
+        # keeps it next to the log, a string keeps it in that directory.
+        if index is True:
+            index = TimeIndex.for_log(logfile)
+        elif isinstance(index, basestring):
+            index = TimeIndex.for_log(logfile, index)
+        self.index = index
+
+        # Offsets of the last line_offsets entries flushed, so that rewinding by
+        # lines doesn't need to read the file backwards. offsets_end is where the
+        # last line flushed ends, foreign is how many bytes at the start of the
+        # buffer are not from the current file.
+        self.offsets = None
+        if line_offsets:
+            self.offsets = deque(maxlen=line_offsets)
+        self.offsets_end = 0
+        self.foreign = 0
+
+        if recent_lines is None:
+            recent_lines = self.RECENT_LINES
+        if recent_bytes is None:
+            recent_bytes = self.RECENT_BYTES
+        self.history = None
+        if recent_lines and recent_bytes:
+            self.history = History(recent_lines, recent_bytes)
 
         self.logfile = logfile
         self.openfile(start=True)
         self.status = None
         self._error = None
-        self.rewind(dtime=self.error_timeout)
+        if not self._resume():
+            self.rewind(dtime=self.error_timeout)
         self.flush()
 
 
+    def _resume(self):
+        """
+        Goes back to where the checkpoint says this log was read up to, unless the
+        file has been rotated or truncated since then.
+        """
+        if self.checkpoint is None or self.log is None:
+            return False
+        saved = self.checkpoint.load(self.logfile)
+        if saved is None:
+            return False
+        inode, offset, status, error = saved
+        if inode != self.inode or offset < 0 or offset > self.size:
+            return False
+        self._seek(offset)
+        if status:
+            self.status = Status(*status)
+        if error:
+            self._error = Error(error[0], error[1], error_timeout=self.error_timeout)
+            if self._error.expired:
+                # Saved before the bot was stopped for longer than error_timeout
+                self._error = None
+        return True
+
+    def save_checkpoint(self):
+        if self.checkpoint is None or self.log is None:
+            return
+        status = error = None
+        if self.status:
+            status = (self.status.message, self.status.tstamp)
+        if self._error:
+            error = (self._error.message, self._error.tstamp)
+        # Partial line in buffer will be read again. Lines left from a rotated
+        # file are not in this one, and are lost if the bot is restarted.
+        self.checkpoint.save(self.logfile, self.inode,
+                             self.pointer - len(self.buffer) + self.foreign,
+                             status, error)
+
     @property
     def real_size(self):
         if os.path.exists(self.logfile):
@@ -135,6 +517,15 @@ class Log(object):
         except AttributeError:
             return 0
 
+    @property
+    def size(self):
+        """
+        Size of the open file, which may not be at logfile anymore if it's been rotated
+        """
+        if self.log is None:
+            return 0
+        return os.fstat(self.log.fileno()).st_size
+
     def openfile(self, start = False):
         try:
             self.log.close()
@@ -143,53 +534,251 @@ class Log(object):
 
         if not os.path.exists(self.logfile):
             self.log = None
+            self.inode = None
             return
             
         try:
             self.log = open(self.logfile)
             self.ctime = os.path.getctime(self.logfile)
+            stat = os.fstat(self.log.fileno())
+            self.inode = (stat.st_dev, stat.st_ino)
             if start:
-                self.log.seek(self.real_size)
+                self._seek(stat.st_size)
         except OSError:
             raise Exception("Log inexistente")
-        
-    def _char_at(self, pos):
-        self.log.seek(pos)
-        return self.log.read(1)
+        self._forget_offsets()
+        self.foreign = len(self.buffer)
 
-    def _rewind_one_line(self):
-        pos = self.pointer - 2
-        
-        while pos > 0 and self._char_at(pos) != '\n':
-            pos -= 1
+    def _forget_offsets(self):
+        if self.offsets is not None:
+            self.offsets.clear()
+        self.offsets_end = 0
 
-        if pos > 0:
-            pos += 1
-            
+    def _follow(self, max_bytes = None):
+        """
+        Reopens the file if it's been truncated, or if there's a new file at logfile.
+        Like tail -F, what was left in a rotated file is read before following the new one,
+        up to max_bytes at a time, and the old file is kept open until it's all read.
+        Returns how many bytes were read from it.
+        """
+        try:
+            stat = os.stat(self.logfile)
+        except OSError:
+            # Moved but not replaced yet, keep reading the old file
+            return 0
+
+        read = 0
+        if self.log is None:
+            self.openfile()
+        elif (stat.st_dev, stat.st_ino) != self.inode:
+            # Unless it was truncated before being rotated
+            rest = max(0, self.size - self.pointer)
+            if max_bytes is not None and rest > max_bytes:
+                if max_bytes:
+                    self._read_into(self.buffer, max_bytes)
+                return max_bytes
+            if rest:
+                self._read_into(self.buffer, rest)
+                read = rest
+            # Last line of old file won't be continued
+            self.buffer.terminate()
+            self.openfile()
+        elif self.pointer > stat.st_size:
+            self.openfile()
+        return read
+
+    def _seek(self, pos):
         self.log.seek(pos)
+
+    def _read(self, size):
+        return self.log.read(size)
+
+    def _readline(self):
+        return self.log.readline()
+
+    def _read_into(self, line_buffer, size):
+        line_buffer.readinto(self.log, size)
         
+    def _reverse_lines(self, end):
+        """
+        Yields (offset, line) for each line before position end, from the last one
+        to the first, reading the file backwards in blocks of BLOCK_SIZE bytes.
+        """
+        pos = end
+        line_end = end
+        tail = None
+        while pos > 0:
+            size = min(self.BLOCK_SIZE, pos)
+            pos -= size
+            self._seek(pos)
+            block = self._read(size)
+            if tail is None:
+                # The newline ending the last line does not start a new one
+                tail = ''
+                if block.endswith('\n'):
+                    block = block[:-1]
+                    line_end -= 1
+            lines = (block + tail).split('\n')
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                line_end -= len(line)
+                yield line_end, line
+                line_end -= 1
+        if tail is not None:
+            yield 0, tail
+
+    def _first_entry(self, pos, end):
+        """
+        Returns (offset, tstamp) of the first parseable line starting between
+        pos and end, or None if there is none.
+        """
+        self._seek(max(pos - 1, 0))
+        if pos > 0:
+            self._readline()
+        while self.pointer < end:
+            offset = self.pointer
+            line = self._readline()
+            try:
+                return offset, self.parse_line(line.rstrip('\n'))[0]
+            except ValueError:
+                # Multi-lined entry, the line belongs to the one before it
+                continue
+        return None
+
+    def _bisect_time(self, timelimit, end):
+        """
+        Binary searches the offset of the first entry newer than timelimit.
+        Lines that can't be parsed are kept with the entry before them.
+        """
+        low, high = 0, end
+        found = end
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._first_entry(middle, high)
+            if entry is None:
+                high = middle
+            elif entry[1] > timelimit:
+                found = entry[0]
+                high = middle
+            else:
+                low = entry[0] + 1
+        if low == 0:
+            # No entry is older than timelimit
+            return 0
+        return found
+
+    def _scan_time(self, timelimit, start, end):
+        """
+        Returns the offset of the first entry newer than timelimit, reading
+        forward from start, which must be the start of a line.
+        """
+        self._seek(start)
+        first = True
+        while self.pointer < end:
+            offset = self.pointer
+            line = self._readline()
+            try:
+                tstamp = self.parse_line(line.rstrip('\n'))[0]
+            except ValueError:
+                continue
+            if tstamp > timelimit:
+                if first and start == 0:
+                    # No entry is older than timelimit
+                    return 0
+                return offset
+            first = False
+        return end
+
+    def _rewind_offsets(self, lines, size):
+        """
+        Returns the offset of the last lines entries, counting the ones not
+        flushed yet and taking the others from the ring of line offsets, or
+        None if the ring doesn't go that far back.
+        """
+        if self.offsets_end > size:
+            # Truncated since the last flush
+            return None
+        i = 0
+        pointer = size
+        if self.offsets_end < size:
+            for position, line in self._reverse_lines(size):
+                if position < self.offsets_end or i >= lines:
+                    break
+                pointer = position
+                try:
+                    self.parse_line(line)
+                except ValueError:
+                    continue
+                i += 1
+        if i >= lines:
+            return pointer
+        if lines - i > len(self.offsets):
+            return None
+        return self.offsets[i - lines]
+
+    def _record_offsets(self, message, base):
+        """
+        Adds the entries of message, found at offset base of the file, to the
+        ring of line offsets. Only as many lines as the ring holds are parsed.
+        """
+        found = []
+        last = self.offsets[-1] if self.offsets else -1
+        end = len(message)
+        while end >= 0 and len(found) < self.offsets.maxlen:
+            start = message.rfind('\n', 0, end) + 1
+            if start < self.foreign or base + start <= last:
+                break
+            try:
+                self.parse_line(message[start:end])
+                found.append(base + start)
+            except ValueError:
+                # Multi-lined entry
+                pass
+            end = start - 1
+        self.offsets.extend(reversed(found))
+
     def rewind(self, lines = None, dtime = None):
+        self.dirty = True
 
-        if dtime:
+        if dtime is not None:
             timelimit = datetime.datetime.now() - datetime.timedelta(0, dtime)
             tstamp = datetime.datetime.now()
         
-        size = self.real_size
+        size = self.size
         if size == 0:
             return
 
-        self.log.seek(size)
+        self._seek(size)
+        # What was left in the buffer is read again from the new position
+        self.buffer.clear()
+        self.foreign = 0
         
         if lines is None and dtime is None:
             return
 
+        if lines is None and self.SORTED:
+            if self.index is not None and self.inode is not None:
+                # Reads from the entry of the index before timelimit
+                self.index.update(self.logfile, self.inode, self.parse_line, size)
+                start, end = self.index.lookup(timelimit)
+                self._seek(self._scan_time(timelimit, start, min(end or size, size)))
+            else:
+                self._seek(self._bisect_time(timelimit, size))
+            return
+
+        if lines is not None and self.offsets is not None:
+            pointer = self._rewind_offsets(lines, size)
+            if pointer is not None:
+                self._seek(pointer)
+                return
+
         i = 0
         non_log_lines = [0]
-        while self.pointer > 0 and (lines is None or i < lines) and (dtime is None or tstamp > timelimit):
-            self._rewind_one_line()
-            position = self.pointer
-            line = self.log.readline()
-            self.log.seek(position)
+        pointer = size
+        for position, line in self._reverse_lines(size):
+            if (lines is not None and i >= lines) or (dtime is not None and tstamp <= timelimit):
+                break
+            pointer = position
             try:
                 tstamp = self.parse_line(line)[0]
             except ValueError:
@@ -201,11 +790,26 @@ class Log(object):
             non_log_lines.append(0)
             i += 1
 
-        if self.pointer > 0 and dtime:
-            self.log.readline()
+        self._seek(pointer)
+
+        if dtime is not None and tstamp <= timelimit:
+            # This entry is older than dtime, skip it and its continuation lines
+            self._readline()
             if len(non_log_lines) > 1:
                 for i in range(0, non_log_lines[-2]):
-                    self.log.readline()
+                    self._readline()
+
+    def recent(self, lines = None, dtime = None):
+        """
+        Text of the last lines entries, or of the last dtime seconds, from
+        the entries kept in memory. None if they may not all be there.
+        """
+        if self.history is None:
+            return None
+        if dtime is not None:
+            timelimit = datetime.datetime.now() - datetime.timedelta(0, dtime)
+            return self.history.since(timelimit, self.parse_line)
+        return self.history.last(lines, self.parse_line)
 
     @property
     def error(self):
@@ -216,24 +820,123 @@ class Log(object):
             return None
         return self._error
 
-    def flush(self):
-        if not self.log or self.pointer > self.real_size:
-            self.openfile()
+    @property
+    def alert(self):
+        """
+        The most severe of the alerts that haven't expired, the latest if more
+        than one are as severe.
+        """
+        alert = None
+        for name, rule_alert in self._alerts.items():
+            if rule_alert.expired:
+                del self._alerts[name]
+            elif alert is None or ((SHOW_PRIORITY[rule_alert.show], rule_alert.tstamp) >
+                                   (SHOW_PRIORITY[alert.show], alert.tstamp)):
+                alert = rule_alert
+        return alert
+
+    def _match_alerts(self, lines):
+        for rule, line in self.alert_rules.match(lines).items():
+            try:
+                tstamp, msgtype, msg = self.parse_line(line)
+            except ValueError:
+                tstamp, msg = datetime.datetime.now(), line
+            self._alerts[rule.name] = Alert(msg, tstamp, rule)
+            self._errors_changed()
+
+    def _errors_changed(self):
+        if self.error_listener is not None:
+            self.error_listener()
 
-        new_bytes = self.real_size - self.pointer
+    def flush(self, max_bytes = None, max_lines = None):
+        """
+        Returns the complete lines written since last flush. At most max_bytes are read
+        from file and at most max_lines are returned, the rest is left for next flush.
+        """
+        self.dirty = False
 
-        if not new_bytes:
+        if max_lines is not None and self.buffer.has_lines(max_lines):
+            max_bytes = 0
+        # What's left in a rotated file is read from what may be read
+        if max_bytes is not None:
+            max_bytes -= self._follow(max_bytes)
+        else:
+            self._follow()
+
+        new_bytes = self.size - self.pointer
+        if max_lines is not None and self.buffer.has_lines(max_lines):
+            # Lines already read are enough, the file is read when they're taken
+            if new_bytes:
+                self.dirty = True
+            new_bytes = 0
+        elif max_bytes is not None and new_bytes >= max_bytes:
+            new_bytes = max_bytes
+            self.dirty = True
+
+        if new_bytes:
+            self._read_into(self.buffer, new_bytes)
+        elif not self.buffer:
             return ''
-        
-        self.buffer += self.log.read(new_bytes)
-        message, br, buf = self.buffer.rpartition('\n')
-        self.buffer = buf
+
+        buffered = len(self.buffer)
+        base = self.pointer - buffered
+        message = self.buffer.pop_lines(max_lines)
+        consumed = buffered - len(self.buffer)
+        if base + self.foreign > self.offsets_end:
+            # Rewound past what was flushed, older offsets would leave a gap
+            self._forget_offsets()
+        if self.offsets is not None:
+            self._record_offsets(message, base)
+        if self.history is not None:
+            # Lines flushed again after rewinding are already there
+            fresh = 0 if self.foreign else max(0, self.offsets_end - base)
+            self.history.add(message[fresh:])
+        if consumed > self.foreign:
+            self.offsets_end = max(self.offsets_end, base + consumed)
+        self.foreign = max(0, self.foreign - consumed)
+        if max_lines is not None and self.buffer.has_lines():
+            self.dirty = True
+        if not self.dirty:
+            self.buffer.shrink()
 
         lines = message.strip()
 
         if not lines:
             return ''
 
+        if self.prefilter:
+            self._parse_last_entries(lines)
+        else:
+            self._parse_entries(lines)
+        if self.alert_rules:
+            self._match_alerts(lines)
+
+        self.save_checkpoint()
+        if self.index is not None and self.inode is not None:
+            self.index.update(self.logfile, self.inode, self.parse_line, self.pointer,
+                              self.INDEX_STEPS)
+
+        return message
+
+    def iterflush(self, chunk_size = None, max_bytes = None, max_lines = None):
+        """
+        Flushes the log in messages of about chunk_size bytes, stopping after max_bytes
+        are read or max_lines are flushed. What is left is flushed in the next call.
+        """
+        lines = 0
+        while True:
+            size = chunk_size
+            if max_bytes is not None:
+                size = min(size or max_bytes, max_bytes)
+                max_bytes -= size
+            message = self.flush(size, None if max_lines is None else max_lines - lines)
+            if message:
+                lines += message.count('\n') + 1
+                yield message
+            if not self.dirty or max_bytes == 0 or lines == max_lines:
+                return
+
+    def _parse_entries(self, lines):
         lines = lines.split('\n')
         
         for line in lines:
@@ -247,33 +950,250 @@ class Log(object):
                 continue
             if msgtype == 'ERROR':
                 self._error = Error(msg, tstamp, error_timeout=self.error_timeout)
+                self._errors_changed()
             elif msgtype == 'INFO':
                 self.status = Status(msg, tstamp)
 
-        return message
+    @property
+    def prefilter(self):
+        """
+        Whether flush can look for level markers instead of parsing every line.
+        This is only possible if parse_line is the one for the default format.
+        """
+        return self.PREFILTER and getattr(self.parse_line, '__func__', None) is Log.parse_line.__func__
+
+    def _last_entry(self, lines, msgtype):
+        """
+        Returns (tstamp, msg) of the last line of the given type, parsing only
+        lines that have the type marker of the default format.
+        """
+        marker = ' - %s - ' % msgtype
+        end = len(lines)
+        while True:
+            pos = lines.rfind(marker, 0, end)
+            if pos < 0:
+                return None
+            start = lines.rfind('\n', 0, pos) + 1
+            stop = lines.find('\n', pos)
+            if stop < 0:
+                stop = len(lines)
+            end = start
+            try:
+                tstamp, line_type, msg = self.parse_line(lines[start:stop])
+            except ValueError:
+                continue
+            if line_type == msgtype:
+                return tstamp, msg
+
+    def _parse_last_entries(self, lines):
+        entry = self._last_entry(lines, 'ERROR')
+        if entry:
+            self._error = Error(entry[1], entry[0], error_timeout=self.error_timeout)
+            self._errors_changed()
+        entry = self._last_entry(lines, 'INFO')
+        if entry:
+            self.status = Status(entry[1], entry[0])
 
     def parse_line(self, line): 
         dtime, name, msgtype, msg = line.split(' - ')
-        tstamp = datetime.datetime.strptime(dtime.split(',')[0], '%Y-%m-%d %H:%M:%S')
+        tstamp = self._parse_time(dtime.split(',')[0])
         return tstamp, msgtype, msg
 
+    def parse_record(self, line):
+        """
+        Same as parse_line, as a LogRecord
+        """
+        return LogRecord.from_line(*self.parse_line(line))
+
+    def parse_level(self, line):
+        """
+        Returns the msg type of line, or None if it's not the start of an entry
+        """
+        if self.prefilter:
+            fields = line.split(' - ', 3)
+            if len(fields) == 4:
+                return fields[2]
+            return None
+        try:
+            return self.parse_line(line)[1]
+        except ValueError:
+            return None
+
+    def _parse_time(self, dtime):
+        """
+        Same as strptime(dtime, '%Y-%m-%d %H:%M:%S'), but slices the fields at fixed
+        offsets, since strptime is too slow for busy logs. Lines logged in the same
+        second as the previous one reuse its datetime.
+        """
+        if dtime == self._last_time[0]:
+            return self._last_time[1]
+        if (len(dtime) == 19 and
+            dtime[4] == dtime[7] == '-' and dtime[10] == ' ' and dtime[13] == dtime[16] == ':' and
+            (dtime[0:4] + dtime[5:7] + dtime[8:10] + dtime[11:13] + dtime[14:16] + dtime[17:19]).isdigit()):
+
+            tstamp = datetime.datetime(int(dtime[0:4]), int(dtime[5:7]), int(dtime[8:10]),
+                                       int(dtime[11:13]), int(dtime[14:16]), int(dtime[17:19]))
+        else:
+            tstamp = datetime.datetime.strptime(dtime, '%Y-%m-%d %H:%M:%S')
+        self._last_time = (dtime, tstamp)
+        return tstamp
+
+
+class MappedLog(Log):
+    """
+    Log that reads the file through a read only memory map instead of a file
+    object, so that flushing and rewinding slice the mapped region directly.
+    The file is mapped again when it grows, and when it's rotated or truncated.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.map = None
+        self.offset = 0
+        super(MappedLog, self).__init__(*args, **kwargs)
+
+    @property
+    def pointer(self):
+        if self.log is None:
+            return 0
+        return self.offset
+
+    def openfile(self, start = False):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.offset = 0
+        super(MappedLog, self).openfile(start)
+
+    def _remap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        size = os.fstat(self.log.fileno()).st_size
+        if size:
+            self.map = mmap.mmap(self.log.fileno(), size, access=mmap.ACCESS_READ)
+
+    def _seek(self, pos):
+        # Everything up to a seeked position must be mapped
+        if pos > 0 and (self.map is None or pos > len(self.map)):
+            self._remap()
+        self.offset = pos
+
+    def _read(self, size):
+        start = self.offset
+        self._seek(start + size)
+        if self.map is None:
+            self.offset = start
+            return ''
+        data = self.map[start:start + size]
+        self.offset = start + len(data)
+        return data
+
+    def _read_into(self, line_buffer, size):
+        start = self.offset
+        self._seek(start + size)
+        if self.map is None:
+            self.offset = start
+            return
+        size = min(size, len(self.map) - start)
+        # A buffer object gives the mapped region without copying it
+        line_buffer.append(buffer(self.map, start, size))
+        self.offset = start + size
+
+    def _readline(self):
+        if self.map is None or self.offset >= len(self.map):
+            return ''
+        end = self.map.find('\n', self.offset) + 1 or len(self.map)
+        line = self.map[self.offset:end]
+        self.offset = end
+        return line
+
+    def _reverse_lines(self, end):
+        if end == 0:
+            return
+        self._seek(end)
+        line_end = end
+        if self.map[end - 1] == '\n':
+            # The newline ending the last line does not start a new one
+            line_end -= 1
+        while True:
+            start = self.map.rfind('\n', 0, line_end) + 1
+            yield start, self.map[start:line_end]
+            if start == 0:
+                return
+            line_end = start - 1
+
 
 class JabberStatus(object):
     def __init__(self, show = None, status = None):
         self.show = show
         self.stauts = status
 
+class CommandStats(object):
+    """
+    Latency, in seconds, of the calls to a command
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.timeouts = 0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def average(self):
+        if not self.calls:
+            return 0.0
+        return self.total / self.calls
+
+class CommandCall(object):
+    """
+    A command running in the Bot's thread pool
+    """
+
+    def __init__(self, sender_id, name):
+        self.sender_id = sender_id
+        self.name = name
+        self.start = time.time()
+        self.timer = None
+        self.timed_out = False
+
 class Bot(object):
 
+    # Units of the "last" option of show
+    TIME_UNITS = { 's': 1, 'm': 60, 'h': 3600, 'd': 86400 }
+
     def __init__(self, jid, password,
                  presence_heartbeat = 60,
                  log_error_timeout = None,
                  log_path = '/tmp/fish-slapping.log',
                  log_name = 'fish-slapping',
                  server = None,
-                 port = 5222):
+                 port = 5222,
+                 watcher = None,
+                 checkpoint = None,
+                 message_size = 64 * 1024,
+                 flush_max_bytes = 1024 * 1024,
+                 flush_max_lines = None,
+                 flush_interval = 1,
+                 status_interval = 1,
+                 expire_interval = 1,
+                 threaded = True,
+                 command_workers = 4,
+                 command_timeout = 30,
+                 command_concurrency = 2,
+                 send_window = 0,
+                 stream_max_lines = None,
+                 stream_max_bytes = None):
 
         self.logger = self._get_logger(log_path, log_name)
+        # Errors and alerts of the logs, pushed by them as they change
+        self.error_index = ErrorIndex()
         self.logs = {}
         self.commands = {}
         self._register_commands()
@@ -285,7 +1205,49 @@ class Bot(object):
 
         self.presence_heartbeat = presence_heartbeat
 
-        self.logs[log_name] = Log(log_path, name=log_name, error_timeout=log_error_timeout)
+        self.watcher = watcher or get_watcher()
+
+        # Logs are flushed up to these limits on each cycle, in messages of message_size
+        self.message_size = message_size
+        self.flush_max_bytes = flush_max_bytes
+        self.flush_max_lines = flush_max_lines
+
+        # Intervals, in seconds, of each task run by run(). Logs are also
+        # flushed as soon as the watcher notices a change.
+        self.flush_interval = flush_interval
+        self.status_interval = status_interval
+        self.expire_interval = expire_interval
+        self.scheduler = None
+        self.socket = None
+
+        # When running, custom commands and status() run in their own threads,
+        # so that a slow one doesn't hold log streaming and presence
+        self.threaded = threaded
+        self.status_result = ('', '')
+        self.status_refreshing = False
+
+        # Custom commands run in a pool of command_workers threads. Each one is
+        # answered with an error after command_timeout seconds (or the value in
+        # command_timeouts for its name), and can't have more than
+        # command_concurrency calls running.
+        self.command_workers = command_workers
+        self.command_timeout = command_timeout
+        self.command_timeouts = {}
+        self.command_concurrency = command_concurrency
+        self.command_pool = None
+        self.running_commands = {}
+        self.command_stats = {}
+
+        # Messages to the same jid within send_window seconds are sent together
+        self.send_window = send_window
+        self.outbox = Outbox(self._send, window=send_window, max_bytes=message_size)
+
+        # Lines and bytes per second streamed by each "show", more are suppressed
+        self.stream_max_lines = stream_max_lines
+        self.stream_max_bytes = stream_max_bytes
+
+        self.logs[log_name] = Log(log_path, name=log_name, error_timeout=log_error_timeout,
+                                  checkpoint=checkpoint)
         
         self.current_status = Status('')
         self.status_msg = ''
@@ -368,18 +1330,92 @@ class Bot(object):
         self.connect()
 
     def run(self):
-        while True:
-            self.cycle()
+        """
+        Runs the bot until stop() is called. Incoming messages and log changes
+        noticed by the watcher are handled as soon as they arrive, the other
+        tasks run on their own intervals.
+        """
+        self.scheduler = Scheduler()
+        # Connects first, the other tasks started right away need the client
+        self.scheduler.every(10, self._task(self.check_connection), now=True)
+        self.scheduler.every(self.flush_interval, self._task(self.flush_logs))
+        self.scheduler.every(self.expire_interval, self._task(self.expire_sessions))
+        if self.threaded:
+            self.scheduler.every(self.status_interval, self._task(self.refresh_status), now=True)
+        self.scheduler.every(self.status_interval, self._task(self.update_state), now=True)
+        self.scheduler.every(self.presence_heartbeat, self._task(self.presence))
+        if self.send_window:
+            self.scheduler.every(self.send_window, self._task(self.outbox.drain))
+        if self.watcher.fileno() is not None:
+            self.scheduler.add_reader(self.watcher.fileno(), self._task(self.flush_logs))
+        self.command_pool = ThreadPool(self.scheduler, self.command_workers)
+        try:
+            self.scheduler.run()
+        finally:
+            self.command_pool.close()
+            self.command_pool = None
+            self.scheduler.close()
+            self.scheduler = None
+
+    @property
+    def running(self):
+        return self.scheduler is not None and self.scheduler.running
+
+    def stop(self):
+        if self.scheduler:
+            self.scheduler.stop()
+
+    def _task(self, function):
+        def task():
+            try:
+                function()
+            except Exception, e:
+                if type(e) is Finish:
+                    return
+                self.logger.error(e)
+        return task
+
+    def check_connection(self):
+        """
+        Reconnects if needed, and makes the scheduler wait on the current socket
+        """
+        if not self.connected:
+            # The old socket is closed, select() can't wait on it anymore
+            self.scheduler.remove_reader(self.socket)
+            self.socket = None
+            self.reconnect()
+        socket = self.client.Connection._sock
+        if socket is not self.socket:
+            self.scheduler.remove_reader(self.socket)
+            self.scheduler.add_reader(socket, self._task(self.process))
+            self.socket = socket
+
+    def process(self):
+        try:
+            self.client.Process(0)
+        finally:
+            if not self.connected:
+                # A disconnection while processing failed to reconnect, the
+                # old socket would be readable forever. check_connection
+                # retries on its own interval.
+                self.scheduler.remove_reader(self.socket)
+                self.socket = None
+        # A disconnection while processing reconnects with a new socket
+        self.check_connection()
 
     def cycle(self):
+        """
+        Runs every task once, blocking up to one second for incoming messages.
+        """
         try:
             if self.connected:
                 self.client.Process(1)
             else:
                 self.reconnect()
             self.flush_logs()
-            self.set_state()
-            self.presence()
+            self.expire_sessions()
+            self.update_state()
+            self.outbox.drain()
         except Exception, e:
             if type(e) is Finish:
                 return
@@ -393,6 +1429,15 @@ class Bot(object):
             self.public_ip_check = time.time()
         return self.public_ip_address
 
+    def send(self, jid, body):
+        """
+        Queues a message to jid in the outbox
+        """
+        self.outbox.put(jid, body)
+
+    def _send(self, jid, body):
+        self.client.send(xmpp.Message(jid, body))
+
     def presence(self):
         if (self.status_msg == self.last_presence_msg and 
             self.last_presence is not None and
@@ -408,22 +1453,77 @@ class Bot(object):
         self.last_presence_msg = self.status_msg
 
     def flush_logs(self):
+        self.watcher.poll(self.logs.values())
+        for logname, log in self.logs.items():
+            if log.dirty:
+                self._flush_log(log)
+            for jid, summary in log.session.summaries():
+                self.send(jid, summary)
+
+    def _flush_log(self, log):
+        # Leaves room for the line break each message starts with
+        for message in log.iterflush(self.message_size - 1,
+                                     self.flush_max_bytes,
+                                     self.flush_max_lines):
+            for jid in log.session.receivers:
+                text = log.session.accept(jid, message)
+                if text:
+                    self.send(jid, '\n' + text)
+
+    def expire_sessions(self):
         for logname, log in self.logs.items():
-            message = log.flush()
-
-            if message:
-                for jid in log.session.receivers:
-                    self.client.send(xmpp.Message(jid, '\n' + message))
-
             expired = log.session.expire()
+            for jid, summary in log.session.summaries():
+                self.send(jid, summary)
             for jid in expired:
-                self.client.send(xmpp.Message(jid, '--- fim de %s' % logname))
+                self.send(jid, '--- fim de %s' % logname)
 
     def clear(self):
         self.cleared = datetime.datetime.now()
 
+    def update_state(self):
+        self.set_state()
+        self.presence()
+
+    def refresh_status(self):
+        """
+        Calls status() in a thread, its result is used by the next set_state().
+        Status providers are only called when their interval has passed.
+        """
+        if self.status_refreshing:
+            return
+        status = self.status
+        if isinstance(status, StatusProvider):
+            if not status.expired():
+                return
+            status = status.refresh
+        self.status_refreshing = True
+        self.scheduler.run_in_thread(status, self._status_refreshed)
+
+    def _status_refreshed(self, result, error):
+        self.status_refreshing = False
+        if error:
+            self.logger.error("Status failed: %s" % error)
+        else:
+            self.status_result = result
+
+    def get_status(self):
+        if self.threaded and self.running:
+            return self.status_result
+        return self.status()
+
+    @property
+    def logs(self):
+        return self._logs
+
+    @logs.setter
+    def logs(self, logs):
+        for name in getattr(self, '_logs', {}).keys():
+            self.error_index.remove(name)
+        self._logs = Logs(self.error_index, logs)
+
     def set_state(self):
-        show, msg = self.status()
+        show, msg = self.get_status()
         status = Status(msg, show=show)
 
         if status.message != self.current_status.message:
@@ -436,17 +1536,16 @@ class Bot(object):
         self.status_msg = '%s %s' % (self.current_status.time,
                                      self.current_status.message)
         
-        tstamp = None
-        for name, log in self.logs.items():
-            if log.error:
-                if self.cleared and log.error.tstamp < self.cleared:
-                    continue
-                if not tstamp or log.error.tstamp > tstamp:
-                    tstamp = log.error.tstamp
-                    self.status_msg = '%s %s: %s' % (log.error.time,
-                                                     name,
-                                                     log.error.message)
-                    self.status_show = 'dnd'
+        # The most severe error or alert is shown, the latest if more than
+        # one are as severe. Logs only need to be asked when theirs changed.
+        shown = self.error_index.top(self.cleared)
+        if shown:
+            name, error = shown
+            self.status_msg = '%s %s: %s' % (error.time,
+                                             name,
+                                             error.message)
+            if SHOW_PRIORITY[error.show] > SHOW_PRIORITY.get(self.current_status.show, 0):
+                self.status_show = error.show
 
 
     def message_callback(self, dispatcher, event):
@@ -463,32 +1562,155 @@ class Bot(object):
         
         cmd = self.commands.get(message[0])
         if cmd:
-            response = cmd(sender_id, message[1:])
-            if response:
-                self.client.send(xmpp.Message(sender_id, response))
+            # Builtin commands change the bot's state, they run in the loop
+            if self.threaded and self.running and getattr(cmd, '__self__', None) is not self:
+                self.dispatch_command(sender_id, message[0], cmd, message[1:])
+            else:
+                call = CommandCall(sender_id, message[0])
+                try:
+                    response = cmd(sender_id, message[1:])
+                except Exception:
+                    self._stats(call.name).errors += 1
+                    raise
+                self._stats(call.name).add(time.time() - call.start)
+                if response:
+                    self.send(sender_id, response)
             return
 
         self.logger.warn("Unknown message")
 
+    def _stats(self, name):
+        stats = self.command_stats.get(name)
+        if stats is None:
+            stats = self.command_stats[name] = CommandStats()
+        return stats
+
+    def dispatch_command(self, sender_id, name, cmd, args):
+        """
+        Runs cmd in the thread pool, its response is sent from the bot's loop
+        """
+        running = self.running_commands.get(name, 0)
+        if running >= self.command_concurrency:
+            self.send(sender_id, "Command %s is busy, try again later" % name)
+            return
+        self.running_commands[name] = running + 1
+
+        call = CommandCall(sender_id, name)
+        timeout = self.command_timeouts.get(name, self.command_timeout)
+        if timeout:
+            call.timer = self.scheduler.call_later(timeout, lambda: self._command_timed_out(call))
+        self.command_pool.submit(lambda: cmd(sender_id, args),
+                                 lambda response, error: self._command_returned(call, response, error))
+
+    def _command_timed_out(self, call):
+        call.timed_out = True
+        self._stats(call.name).timeouts += 1
+        self.logger.warn("Command %s timed out" % call.name)
+        self.send(call.sender_id, "Command %s timed out" % call.name)
+
+    def _command_returned(self, call, response, error):
+        # A thread can't be killed, a command that timed out still counts
+        # as running until it returns
+        self.running_commands[call.name] -= 1
+        if call.timer:
+            call.timer.cancel()
+
+        stats = self._stats(call.name)
+        stats.add(time.time() - call.start)
+        if error:
+            stats.errors += 1
+            self.logger.error("Command %s failed: %s" % (call.name, error))
+        elif response and not call.timed_out:
+            self.send(call.sender_id, response)
+
     def cmd_show(self, sender_id, message):
         """
-        Show the last lines of the given log. Takes two parameters:
+        Show the last lines of the given log. Takes these parameters:
           * log_name: the name of the Log
           * number_of_lines: number of lines initially shown, default 5
+          * level LEVEL: optional, shows only entries of LEVEL or above
+          * grep REGEX: optional, must be the last one, shows only lines matching REGEX
+          * since HH:MM or last TIME: optional, instead of number_of_lines shows lines
+            since that time of day, or of the last TIME, as in 30m, 2h or 1d
         After this commands, new lines in log will be continuously shown. Use "stop" to end.
         """
         target = message[0]
-        if len(message) > 1:
-            lines = int(message[1])
-        else:
-            lines = 5
+        args = message[1:]
+        lines = 5
+        if args and args[0].isdigit():
+            lines = int(args.pop(0))
+        level = grep = dtime = None
+        try:
+            while args:
+                option = args.pop(0)
+                if option == 'since':
+                    dtime = self._since(args.pop(0))
+                    if dtime is None:
+                        return "Invalid time, use HH:MM"
+                elif option == 'last':
+                    dtime = self._last(args.pop(0))
+                    if dtime is None:
+                        return "Invalid time, use a number followed by s, m, h or d"
+                elif option == 'level':
+                    level = args.pop(0).upper()
+                    if level not in LEVELS:
+                        return "Unknown level %s" % level
+                elif option == 'grep':
+                    grep = ' '.join(args)
+                    args = []
+                    re.compile(grep)
+                else:
+                    return "Unknown option %s" % option
+        except IndexError:
+            return "Missing value of %s" % option
+        except re.error, e:
+            return "Invalid expression %s: %s" % (grep, e)
 
         if not self.logs.get(target):
-            self.client.send(xmpp.Message(sender_id, "Target %s unknown" % target))
+            self.send(sender_id, "Target %s unknown" % target)
             self.logger.warn("Target %s unknown" % target)
         else:
-            self.logs[target].session.add(sender_id)
-            self.logs[target].rewind(lines=lines)
+            log = self.logs[target]
+            # Lines written until now go to the sessions there were
+            self._flush_log(log)
+            log.session.add(sender_id,
+                            max_lines=self.stream_max_lines,
+                            max_bytes=self.stream_max_bytes,
+                            level=level, grep=grep, parse_level=log.parse_level)
+            recent = log.recent(lines=lines, dtime=dtime)
+            if recent is None:
+                # Not in memory, read again from the file for everyone
+                if dtime is not None:
+                    log.rewind(dtime=dtime)
+                else:
+                    log.rewind(lines=lines)
+            elif recent:
+                # Only for this session, new lines come with the next flush
+                text = log.session.accept(sender_id, recent)
+                if text:
+                    self.send(sender_id, '\n' + text)
+
+    def _since(self, value):
+        """
+        Seconds since the last time the clock showed HH:MM or HH:MM:SS
+        """
+        try:
+            fields = [ int(field) for field in value.split(':') ]
+            if len(fields) == 2:
+                fields.append(0)
+            now = datetime.datetime.now()
+            since = now.replace(hour=fields[0], minute=fields[1], second=fields[2], microsecond=0)
+        except (ValueError, IndexError, TypeError):
+            return None
+        if since > now:
+            since -= datetime.timedelta(1)
+        return (now - since).total_seconds()
+
+    def _last(self, value):
+        unit = self.TIME_UNITS.get(value[-1:])
+        if unit is None or not value[:-1].isdigit():
+            return None
+        return int(value[:-1]) * unit
 
     def cmd_stop(self, sender_id, message):
         """
@@ -513,6 +1735,22 @@ class Bot(object):
 
         return '\n'.join(help_text)
 
+    def cmd_stats(self, sender_id, message):
+        """
+        Shows how many times each command was called and how long it took.
+        """
+        lines = ['']
+        for name, stats in sorted(self.command_stats.items()):
+            lines.append('%s: %d calls, avg %.0fms, max %.0fms, %d errors, %d timeouts' %
+                         (name, stats.calls, stats.average * 1000, stats.max * 1000,
+                          stats.errors, stats.timeouts))
+        if self.command_pool:
+            lines.append('%d commands queued' % self.command_pool.pending)
+        lines.append('%d messages queued, %d at most, %d sent, %d coalesced' %
+                     (self.outbox.depth, self.outbox.max_depth, self.outbox.sent,
+                      self.outbox.coalesced))
+        return '\n'.join(lines)
+
     def cmd_clear(self, sender_id, message):
         """
         Sets the status of the bot to its default status, in case it's been set by an error
@@ -524,11 +1762,11 @@ class Bot(object):
     def _cmd_uptime(self, sender_id, message):
         # disabled. TODO move to plugin
         message = subprocess.Popen(['uptime'], stdout=subprocess.PIPE).stdout.read()
-        self.client.send(xmpp.Message(sender_id, '\n' + message))
+        self.send(sender_id, '\n' + message)
 
     def _cmd_ip(self, sender_id, message):
         # disabled. TODO be move to plugin
-        self.client.send(xmpp.Message(sender_id, self.public_ip()))
+        self.send(sender_id, self.public_ip())
 
 if __name__ == '__main__':
     Bot().run()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re, sre_parse, sre_constants
+from fish_slapping.status import SHOW_PRIORITY
+
+class AlertRule(object):
+    """
+    A regular expression that, when found in a log line, sets the bot's
+    status to show ('dnd' or 'away') for timeout seconds. ^ and $ match at
+    the start and end of the line.
+    """
+
+    def __init__(self, name, pattern, show = 'dnd', timeout = 3600):
+        if not show or show not in SHOW_PRIORITY:
+            raise ValueError("Alert rule %s: show must be 'dnd' or 'away', not %r" % (name, show))
+        self.name = name
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.MULTILINE)
+        self.show = show
+        self.timeout = timeout
+
+class AlertRules(object):
+    """
+    A set of AlertRules. Patterns are joined in one expression, so that the
+    lines of a flush are searched in a single pass however many rules there
+    are. Only lines found by it are checked against each rule.
+
+    Patterns are joined without groups, since the expression is only used to
+    find candidate lines, so that when all of them start with a literal the
+    regex engine skips ahead to where they can match. Patterns that don't
+    are joined in another expression. Patterns that set flags, which would
+    apply to the whole expression, or that refer to their groups by number,
+    which would be renumbered, have expressions of their own.
+    """
+
+    def __init__(self, rules = ()):
+        self.rules = list(rules)
+        self._combined = None
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, rule):
+        self.rules.append(rule)
+        self._combined = None
+
+    def _combine(self, rules):
+        """
+        Returns [ (expression, rules) ], usually with only one expression
+        """
+        try:
+            pattern = '|'.join([ rule.pattern for rule in rules ])
+            return [ (re.compile(pattern, re.MULTILINE), rules) ]
+        except (AssertionError, OverflowError, re.error):
+            # Too many groups for one expression
+            if len(rules) == 1:
+                raise
+            half = len(rules) / 2
+            return self._combine(rules[:half]) + self._combine(rules[half:])
+
+    def _refers_to_groups(self, value):
+        if isinstance(value, sre_parse.SubPattern):
+            value = value.data
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                if item in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+                    return True
+                if self._refers_to_groups(item):
+                    return True
+        return False
+
+    def _kind(self, rule):
+        parsed = sre_parse.parse(rule.pattern)
+        if parsed.pattern.flags or self._refers_to_groups(parsed):
+            return None
+        # Only alternatives that all start with a literal character let sre skip
+        # ahead, a character class in one of them would stop it for all
+        if parsed.data and parsed.data[0][0] == sre_constants.LITERAL:
+            return 'literal'
+        return 'other'
+
+    @property
+    def combined(self):
+        if self._combined is None:
+            kinds = { 'literal': [], 'other': [] }
+            self._combined = []
+            for rule in self.rules:
+                kind = self._kind(rule)
+                if kind is None:
+                    self._combined.append((rule.regex, [rule]))
+                else:
+                    kinds[kind].append(rule)
+            for kind in ('literal', 'other'):
+                if kinds[kind]:
+                    self._combined += self._combine(kinds[kind])
+        return self._combined
+
+    def match(self, lines):
+        """
+        Returns { rule: line } with the last line of lines matching each rule
+        """
+        matches = {}
+        if not self.rules:
+            return matches
+        for regex, rules in self.combined:
+            pos = 0
+            while True:
+                found = regex.search(lines, pos)
+                if found is None:
+                    break
+                start = lines.rfind('\n', 0, found.start()) + 1
+                pos = lines.find('\n', found.start())
+                if pos < 0:
+                    pos = len(lines)
+                line = lines[start:pos]
+                for rule in rules:
+                    if rule.regex.search(line):
+                        matches[rule] = line
+                pos += 1
+                if pos > len(lines):
+                    # A rule matched the empty string at the end, search would
+                    # find it again there
+                    break
+        return matches
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sqlite3, datetime
+
+class CheckpointStore(object):
+    """
+    Keeps, for each log file, the file's inode, the offset up to where it has
+    been read and its last status and error, so that a restarted bot goes on
+    from there instead of scanning the log again.
+    """
+
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.text_factory = str
+        # A lost checkpoint only costs a rescan, no need to wait for the disk
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE IF NOT EXISTS checkpoint ('
+                        'logfile TEXT PRIMARY KEY, device INTEGER, inode INTEGER, offset INTEGER, '
+                        'status_message TEXT, status_time TEXT, '
+                        'error_message TEXT, error_time TEXT)')
+        self.db.commit()
+
+    def _time(self, tstamp):
+        if tstamp is None:
+            return None
+        return datetime.datetime.strptime(tstamp, self.TIME_FORMAT)
+
+    def load(self, logfile):
+        """
+        Returns ((device, inode), offset, status, error) saved for logfile, or None.
+        Status and error are (message, tstamp) tuples, or None.
+        """
+        row = self.db.execute('SELECT device, inode, offset, status_message, status_time, '
+                              'error_message, error_time FROM checkpoint WHERE logfile = ?',
+                              (logfile,)).fetchone()
+        if row is None:
+            return None
+        device, inode, offset, status_message, status_time, error_message, error_time = row
+        status = error = None
+        if status_time is not None:
+            status = (status_message, self._time(status_time))
+        if error_time is not None:
+            error = (error_message, self._time(error_time))
+        return (device, inode), offset, status, error
+
+    def save(self, logfile, inode, offset, status = None, error = None):
+        status_message, status_time = status or (None, None)
+        error_message, error_time = error or (None, None)
+        if status_time is not None:
+            status_time = status_time.strftime(self.TIME_FORMAT)
+        if error_time is not None:
+            error_time = error_time.strftime(self.TIME_FORMAT)
+        self.db.execute('INSERT OR REPLACE INTO checkpoint VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (logfile, inode[0], inode[1], offset,
+                         status_message, status_time, error_message, error_time))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
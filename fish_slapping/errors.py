@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime, heapq, itertools, functools
+from fish_slapping.status import SHOW_PRIORITY
+
+class ErrorIndex(object):
+    """
+    The errors and alerts of a set of logs, so that the one to be shown can
+    be found without asking every log. Logs call changed() when theirs
+    change, and a log is only asked again then, or when its error or alert
+    may have expired. The one to be shown is kept until any of that happens.
+    """
+
+    def __init__(self):
+        self.logs = {}
+        # name => [ Error or Alert ], only for logs that have any
+        self.errors = {}
+        self.pending = set()
+        # (when, sequence, name), when the errors of a log may expire, and
+        # the first of them for each log
+        self.deadlines = []
+        self.sequence = itertools.count()
+        self.due = {}
+        self.cleared = None
+        self.stale = False
+        self.shown = None
+
+    def add(self, name, log):
+        self.remove(name)
+        self.logs[name] = log
+        log.error_listener = functools.partial(self.changed, name)
+        self.changed(name)
+
+    def remove(self, name):
+        log = self.logs.pop(name, None)
+        if log is not None:
+            log.error_listener = None
+        self.pending.discard(name)
+        self.due.pop(name, None)
+        if self.errors.pop(name, None):
+            self.stale = True
+
+    def changed(self, name):
+        self.pending.add(name)
+
+    def _look(self, name, now):
+        log = self.logs.get(name)
+        if log is None:
+            return
+        errors = [ error for error in (log.error, log.alert) if error ]
+        if errors or name in self.errors:
+            self.stale = True
+        if not errors:
+            self.errors.pop(name, None)
+            return
+        self.errors[name] = errors
+        # Error.expired is true once a second more than its timeout has passed
+        when = min([ error.tstamp + datetime.timedelta(0, error.error_timeout + 1)
+                     for error in errors ])
+        when = max(when, now + datetime.timedelta(0, 1))
+        if name not in self.due or when < self.due[name]:
+            self.due[name] = when
+            heapq.heappush(self.deadlines, (when, next(self.sequence), name))
+
+    def top(self, cleared = None):
+        """
+        Returns (name, error) of the most severe error or alert after cleared,
+        the latest if more than one are as severe, or None. Errors are as
+        severe as dnd alerts.
+        """
+        now = datetime.datetime.now()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            when, sequence, name = heapq.heappop(self.deadlines)
+            if self.due.get(name) == when:
+                del self.due[name]
+                self.pending.add(name)
+        while self.pending:
+            self._look(self.pending.pop(), now)
+        if cleared != self.cleared:
+            self.cleared = cleared
+            self.stale = True
+        if self.stale:
+            self.stale = False
+            self.shown = None
+            priority = None
+            for name, errors in self.errors.items():
+                for error in errors:
+                    if cleared and error.tstamp < cleared:
+                        continue
+                    error_priority = (SHOW_PRIORITY[error.show], error.tstamp)
+                    if not priority or error_priority > priority:
+                        priority = error_priority
+                        self.shown = name, error
+        return self.shown
+
+class Logs(dict):
+    """
+    The logs of a bot, by name. Logs are added to and removed from an
+    ErrorIndex with it.
+    """
+
+    def __init__(self, index, logs = ()):
+        super(Logs, self).__init__()
+        self.index = index
+        self.update(logs)
+
+    def __setitem__(self, name, log):
+        super(Logs, self).__setitem__(name, log)
+        self.index.add(name, log)
+
+    def __delitem__(self, name):
+        super(Logs, self).__delitem__(name)
+        self.index.remove(name)
+
+    def pop(self, name, *default):
+        self.index.remove(name)
+        return super(Logs, self).pop(name, *default)
+
+    def update(self, logs = (), **kwargs):
+        for name, log in dict(logs, **kwargs).items():
+            self[name] = log
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from collections import deque
+
+class History(object):
+    """
+    The last lines flushed from a log, up to max_lines lines and max_bytes
+    bytes, so that they can be shown without reading the file again. Lines
+    are copied into one reusable buffer, as they were flushed, and only
+    parsed when they are looked up, from the last one backwards, as
+    Log.rewind does.
+    """
+
+    def __init__(self, max_lines = 1000, max_bytes = 256 * 1024):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        # Each block of lines with its line break, in the order they were added
+        self.data = bytearray()
+        self.bytes = 0
+        # (bytes, lines) of each block
+        self.blocks = deque()
+        self.lines = 0
+
+    def __len__(self):
+        return self.lines
+
+    def add(self, lines):
+        """
+        Adds lines, a block of complete lines without the last line break.
+        Only as many of its last lines as can be kept are stored, and older
+        blocks are dropped whole to make room for them.
+        """
+        if not lines:
+            return
+        cut = len(lines)
+        for count in range(1, self.max_lines + 1):
+            cut = lines.rfind('\n', 0, cut)
+            if cut < 0:
+                break
+        if len(lines) - cut > self.max_bytes:
+            cut = lines.find('\n', len(lines) - self.max_bytes)
+            if cut < 0:
+                # Not even the last line fits, what's kept would have a gap
+                self.clear()
+                return
+            count = lines.count('\n', cut)
+        size = len(lines) - cut
+
+        dropped = 0
+        while self.blocks and (self.lines + count > self.max_lines or
+                               self.bytes + size > self.max_bytes):
+            block_bytes, block_lines = self.blocks.popleft()
+            dropped += block_bytes
+            self.bytes -= block_bytes
+            self.lines -= block_lines
+        if dropped:
+            self.data[:self.bytes] = self.data[dropped:dropped + self.bytes]
+        if len(self.data) < self.bytes + size:
+            self.data.extend(bytearray(min(self.max_bytes, max(self.bytes + size, 2 * len(self.data)))
+                                       - len(self.data)))
+        self.data[self.bytes:self.bytes + size - 1] = memoryview(lines)[cut + 1:]
+        self.data[self.bytes + size - 1] = ord('\n')
+        self.bytes += size
+        self.blocks.append((size, count))
+        self.lines += count
+
+    def clear(self):
+        self.bytes = self.lines = 0
+        self.blocks.clear()
+
+    def _reverse_lines(self, text):
+        """
+        Yields (start, line) for each line of text, from the last one to the first
+        """
+        end = len(text)
+        while end >= 0:
+            start = text.rfind('\n', 0, end) + 1
+            yield start, text[start:end]
+            end = start - 1
+
+    def _text(self):
+        if not self.bytes:
+            return ''
+        return str(self.data[:self.bytes - 1])
+
+    def last(self, count, parse_line):
+        """
+        Text of the last count entries, or None if fewer are kept
+        """
+        if count == 0:
+            return ''
+        found = 0
+        text = self._text()
+        for start, line in self._reverse_lines(text):
+            try:
+                parse_line(line)
+            except ValueError:
+                # Multi-lined entry
+                continue
+            found += 1
+            if found == count:
+                return text[start:]
+        return None
+
+    def since(self, timelimit, parse_line):
+        """
+        Text of the entries after the last one older than timelimit, or None
+        if there's no such entry kept, so that older ones may be missing.
+        """
+        newer = None
+        text = self._text()
+        for start, line in self._reverse_lines(text):
+            try:
+                tstamp = parse_line(line)[0]
+            except ValueError:
+                continue
+            if tstamp <= timelimit:
+                if newer is None:
+                    return ''
+                return text[newer:]
+            newer = start
+        return None
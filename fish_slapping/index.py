@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, bisect, calendar
+
+class TimeIndex(object):
+    """
+    Sparse index of a sorted log: the offset and time of one entry about
+    every interval bytes. It's kept in a file, with the device and inode of
+    the log in the first line and one "seconds offset" line per entry, and
+    is started over when the log is rotated.
+    """
+
+    INTERVAL = 64 * 1024
+
+    def __init__(self, path, interval = None):
+        self.path = path
+        self.interval = interval or self.INTERVAL
+        self.inode = None
+        self.times = []
+        self.offsets = []
+        self._load()
+
+    @classmethod
+    def for_log(cls, logfile, directory = None, interval = None):
+        """
+        Index of logfile, next to it or in the given directory
+        """
+        if directory is None:
+            return cls(logfile + '.idx', interval)
+        name = os.path.abspath(logfile).strip('/').replace('/', '_')
+        return cls(os.path.join(directory, name + '.idx'), interval)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as index:
+            header = index.readline().split()
+            if len(header) != 2:
+                return
+            self.inode = (int(header[0]), int(header[1]))
+            for line in index:
+                if not line.endswith('\n'):
+                    # Interrupted while writing
+                    break
+                seconds, offset = line.split()
+                self.times.append(int(seconds))
+                self.offsets.append(int(offset))
+
+    def reset(self, inode):
+        self.inode = inode
+        self.times = []
+        self.offsets = []
+        with open(self.path, 'w') as index:
+            index.write('%d %d\n' % inode)
+
+    def _seconds(self, tstamp):
+        return calendar.timegm(tstamp.timetuple())
+
+    def update(self, logfile, inode, parse_line, end, max_entries = None):
+        """
+        Indexes logfile up to offset end, adding at most max_entries. Does
+        nothing if the file at logfile is not the one with the given inode.
+        """
+        if inode != self.inode:
+            self.reset(inode)
+        if self.offsets:
+            pos = self.offsets[-1] + self.interval
+        else:
+            pos = 0
+        if pos >= end:
+            return
+        try:
+            log = open(logfile)
+        except IOError:
+            return
+        added = []
+        with log:
+            stat = os.fstat(log.fileno())
+            if (stat.st_dev, stat.st_ino) != inode:
+                return
+            while pos < end and (max_entries is None or len(added) < max_entries):
+                log.seek(max(pos - 1, 0))
+                if pos > 0:
+                    # Skips to the start of the next line
+                    log.readline()
+                entry = None
+                while log.tell() < end:
+                    offset = log.tell()
+                    line = log.readline()
+                    if not line.endswith('\n'):
+                        break
+                    try:
+                        entry = (self._seconds(parse_line(line[:-1])[0]), offset)
+                        break
+                    except ValueError:
+                        # Multi-lined entry, the line belongs to the one before it
+                        continue
+                if entry is None:
+                    break
+                added.append(entry)
+                pos = entry[1] + self.interval
+        if not added:
+            return
+        with open(self.path, 'a') as index:
+            for seconds, offset in added:
+                index.write('%d %d\n' % (seconds, offset))
+                self.times.append(seconds)
+                self.offsets.append(offset)
+
+    def lookup(self, tstamp):
+        """
+        Returns (start, end), offsets between which the first entry newer
+        than tstamp is. end is None if it may be anywhere after start.
+        """
+        i = bisect.bisect_right(self.times, self._seconds(tstamp))
+        start = end = None
+        if i > 0:
+            start = self.offsets[i - 1]
+        if i < len(self.offsets):
+            end = self.offsets[i]
+        return start or 0, end
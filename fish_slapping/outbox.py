@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+from collections import OrderedDict
+
+class Outbox(object):
+    """
+    Messages waiting to be sent. Messages to the same jid within window
+    seconds are joined, up to max_bytes per message, and sent together by
+    drain(). Bodies bigger than max_bytes are split at line breaks.
+    With window 0, messages are sent as soon as they are put.
+    """
+
+    def __init__(self, send, window = 0, max_bytes = 64 * 1024, clock = time.time):
+        self.send = send
+        self.window = window
+        self.max_bytes = max_bytes
+        self.clock = clock
+        # jid => (time of the oldest message, [ bodies ])
+        self.queues = OrderedDict()
+        self.depth = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return self.depth
+
+    def put(self, jid, body):
+        queue = self.queues.get(jid)
+        if queue is None:
+            queue = self.queues[jid] = (self.clock(), [])
+        queue[1].append(body)
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        if not self.window:
+            self._send(jid)
+
+    def _split(self, body):
+        while len(body) > self.max_bytes:
+            cut = body.rfind('\n', 1, self.max_bytes)
+            if cut < 0:
+                yield body[:self.max_bytes]
+                body = body[self.max_bytes:]
+            else:
+                yield body[:cut]
+                body = body[cut + 1:]
+        yield body
+
+    def _send(self, jid):
+        bodies = self.queues.pop(jid)[1]
+        self.depth -= len(bodies)
+        message = None
+        for body in bodies:
+            for piece in self._split(body):
+                if message is None:
+                    message = piece
+                else:
+                    joined = piece
+                    if not joined.startswith('\n'):
+                        joined = '\n' + joined
+                    if len(message) + len(joined) > self.max_bytes:
+                        self.send(jid, message)
+                        self.sent += 1
+                        message = piece
+                    else:
+                        message += joined
+                        self.coalesced += 1
+        self.send(jid, message)
+        self.sent += 1
+
+    def drain(self, force = False):
+        """
+        Sends messages that have waited for the window, or all if force is True
+        """
+        now = self.clock()
+        for jid, (since, bodies) in self.queues.items():
+            if force or now - since >= self.window:
+                self._send(jid)
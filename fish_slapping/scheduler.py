@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, time, select, errno, fcntl, heapq, itertools, threading, collections, functools, Queue
+
+class Timer(object):
+    """
+    A callback called after interval seconds by a Scheduler, and then every
+    interval seconds if repeat is True, until cancelled.
+    """
+
+    def __init__(self, interval, callback, repeat = True):
+        self.interval = interval
+        self.callback = callback
+        self.repeat = repeat
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler(object):
+    """
+    Runs timers and callbacks for readable file descriptors. Between them, it
+    sleeps in select() until either a descriptor is readable or the next timer
+    is due, so nothing runs while there's nothing to do.
+    """
+
+    def __init__(self, clock = time.time):
+        self.clock = clock
+        self.timers = []
+        self.sequence = itertools.count()
+        self.readers = {}
+        self.running = False
+        self.pending = collections.deque()
+        self.wakeup = None
+        # Held while writing to the wakeup pipe, so that it isn't closed meanwhile
+        self.wakeup_lock = threading.Lock()
+
+    def _push(self, when, timer):
+        heapq.heappush(self.timers, (when, next(self.sequence), timer))
+
+    def every(self, interval, callback, now = False):
+        """
+        Calls callback every interval seconds. The first call is right away if
+        now is True, or after interval seconds otherwise. Returns a Timer.
+        """
+        timer = Timer(interval, callback)
+        when = self.clock()
+        if not now:
+            when += interval
+        self._push(when, timer)
+        return timer
+
+    def call_later(self, delay, callback):
+        """
+        Calls callback once, after delay seconds. Returns a Timer.
+        """
+        timer = Timer(delay, callback, repeat=False)
+        self._push(self.clock() + delay, timer)
+        return timer
+
+    def add_reader(self, fileobj, callback):
+        """
+        Calls callback whenever fileobj, a file descriptor or an object with
+        fileno(), is readable.
+        """
+        self.readers[fileobj] = callback
+
+    def remove_reader(self, fileobj):
+        self.readers.pop(fileobj, None)
+
+    def call_soon_threadsafe(self, callback):
+        """
+        Calls callback from the scheduler's loop. May be called from any thread,
+        once the scheduler is prepared for it with open_wakeup(). Callbacks from
+        threads that finish after the scheduler is closed are dropped.
+        """
+        with self.wakeup_lock:
+            if self.wakeup is None:
+                return
+            self.pending.append(callback)
+            try:
+                os.write(self.wakeup[1], '\0')
+            except OSError, e:
+                # Pipe is full, the loop will wake up anyway
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def open_wakeup(self):
+        """
+        Lets other threads wake the loop up. Must be called from the loop's
+        thread, before it waits for anything they do.
+        """
+        if self.wakeup is not None:
+            return
+        wakeup = os.pipe()
+        for fd in wakeup:
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.add_reader(wakeup[0], self._run_pending)
+        self.wakeup = wakeup
+
+    def _run_pending(self):
+        try:
+            while os.read(self.wakeup[0], 4096):
+                pass
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+        while self.pending:
+            self.pending.popleft()()
+
+    def run_in_thread(self, function, callback):
+        """
+        Calls function in a new thread. When it's done, callback(result, error)
+        is called from the scheduler's loop, with error being the exception
+        raised by function, if any.
+        """
+        def work():
+            try:
+                result, error = function(), None
+            except Exception, e:
+                result, error = None, e
+            self.call_soon_threadsafe(lambda: callback(result, error))
+        self.open_wakeup()
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def timeout(self):
+        """
+        Seconds until the next timer is due, or None if there are no timers.
+        """
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - self.clock())
+
+    def run_once(self):
+        timeout = self.timeout()
+        if self.readers:
+            try:
+                ready = select.select(self.readers.keys(), [], [], timeout)[0]
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                ready = []
+            for fileobj in ready:
+                callback = self.readers.get(fileobj)
+                if callback:
+                    callback()
+        elif timeout:
+            time.sleep(timeout)
+
+        now = self.clock()
+        while self.timers and self.timers[0][0] <= now:
+            when, sequence, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            timer.callback()
+            if not timer.repeat:
+                continue
+            when += timer.interval
+            if when <= now:
+                # A late timer runs once, not once for every interval missed
+                when = now + timer.interval
+            self._push(when, timer)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        with self.wakeup_lock:
+            if self.wakeup is not None:
+                self.remove_reader(self.wakeup[0])
+                for fd in self.wakeup:
+                    os.close(fd)
+                self.wakeup = None
+
+class ThreadPool(object):
+    """
+    Runs functions in up to size worker threads. Functions submitted while
+    all workers are busy wait in a queue. As with Scheduler.run_in_thread,
+    callback(result, error) is called from the scheduler's loop.
+    """
+
+    def __init__(self, scheduler, size):
+        self.scheduler = scheduler
+        self.size = size
+        self.queue = Queue.Queue()
+        self.threads = []
+        self.idle = 0
+        self.lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self.queue.qsize()
+
+    def submit(self, function, callback):
+        self.scheduler.open_wakeup()
+        with self.lock:
+            if self.idle <= self.queue.qsize() and len(self.threads) < self.size:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        self.queue.put((function, callback))
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.idle += 1
+            job = self.queue.get()
+            with self.lock:
+                self.idle -= 1
+            if job is None:
+                return
+            function, callback = job
+            try:
+                result, error = function(), None
+            except Exception, e:
+                result, error = None, e
+            # Bound now, the worker moves on to the next job before it's called
+            self.scheduler.call_soon_threadsafe(functools.partial(callback, result, error))
+
+    def close(self):
+        for thread in self.threads:
+            self.queue.put(None)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Status providers can be used as Bot.status. Like any status function they
+# return a (show, message) tuple, but they only compute it again after their
+# interval, in seconds, has passed.
+
+import time
+
+SHOW_PRIORITY = { '': 0, 'away': 1, 'dnd': 2 }
+
+class StatusProvider(object):
+    """
+    Base class of status providers. Subclasses implement read().
+    """
+
+    INTERVAL = 60
+
+    def __init__(self, interval = None):
+        if interval is None:
+            interval = self.INTERVAL
+        self.interval = interval
+        self.value = None
+        self.updated = None
+
+    def read(self):
+        raise NotImplementedError
+
+    def expired(self):
+        return self.updated is None or time.time() - self.updated >= self.interval
+
+    def refresh(self):
+        self.value = self.read()
+        self.updated = time.time()
+        return self.value
+
+    def __call__(self):
+        if self.expired():
+            return self.refresh()
+        return self.value
+
+    def _show(self, value, away, dnd):
+        if dnd is not None and value > dnd:
+            return 'dnd'
+        if away is not None and value > away:
+            return 'away'
+        return ''
+
+class CachedStatus(StatusProvider):
+    """
+    Caches the result of any status function for interval seconds
+    """
+
+    def __init__(self, function, interval = None):
+        super(CachedStatus, self).__init__(interval)
+        self.function = function
+
+    def read(self):
+        return self.function()
+
+class StatusGroup(StatusProvider):
+    """
+    Joins the messages of several providers. The show of the group is the
+    most severe among them. Each provider is refreshed on its own interval.
+    """
+
+    def __init__(self, *providers):
+        super(StatusGroup, self).__init__(min([ provider.interval for provider in providers ]))
+        self.providers = providers
+
+    def read(self):
+        show, messages = '', []
+        for provider in self.providers:
+            provider_show, message = provider()
+            if SHOW_PRIORITY[provider_show] > SHOW_PRIORITY[show]:
+                show = provider_show
+            messages.append(message)
+        return show, ', '.join(messages)
+
+class LoadStatus(StatusProvider):
+    """
+    Load average from /proc/loadavg. Shows as away or dnd when the load of
+    the last minute is over the given values.
+    """
+
+    INTERVAL = 10
+
+    def __init__(self, interval = None, away = 2, dnd = 4, path = '/proc/loadavg'):
+        super(LoadStatus, self).__init__(interval)
+        self.away = away
+        self.dnd = dnd
+        self.path = path
+
+    def read(self):
+        with open(self.path) as proc:
+            loads = [ float(load) for load in proc.read().split()[:3] ]
+        return (self._show(loads[0], self.away, self.dnd),
+                'load average: %.2f, %.2f, %.2f' % tuple(loads))
+
+class MemoryStatus(StatusProvider):
+    """
+    Memory usage from /proc/meminfo. Shows as away or dnd when the percentage
+    of memory used is over the given values.
+    """
+
+    INTERVAL = 30
+
+    def __init__(self, interval = None, away = None, dnd = None, path = '/proc/meminfo'):
+        super(MemoryStatus, self).__init__(interval)
+        self.away = away
+        self.dnd = dnd
+        self.path = path
+
+    def read(self):
+        info = {}
+        with open(self.path) as proc:
+            for line in proc:
+                name, value = line.split(':', 1)
+                info[name] = int(value.split()[0])
+        total = info['MemTotal']
+        available = info.get('MemAvailable')
+        if available is None:
+            # Older kernels
+            available = info['MemFree'] + info.get('Buffers', 0) + info.get('Cached', 0)
+        used = total - available
+        percent = 100.0 * used / total
+        return (self._show(percent, self.away, self.dnd),
+                'memory: %.0f%% used (%d of %d MB)' % (percent, used / 1024, total / 1024))
+
+class UptimeStatus(StatusProvider):
+    """
+    Time since boot, from /proc/uptime
+    """
+
+    def __init__(self, interval = None, path = '/proc/uptime'):
+        super(UptimeStatus, self).__init__(interval)
+        self.path = path
+
+    def read(self):
+        with open(self.path) as proc:
+            seconds = int(float(proc.read().split()[0]))
+        days, seconds = divmod(seconds, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        return '', 'up %d days, %d:%02d' % (days, hours, seconds / 60)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import fudge
+from fish_slapping.tests import BaseTest
+
+from fish_slapping import Bot, Log, AlertRule, AlertRules
+
+class AlertRulesTest(BaseTest):
+
+    def test_last_line_matching_each_rule_is_found(self):
+        disk = AlertRule('disk', 'No space left')
+        slow = AlertRule('slow', r'took \d{4,} ms', show='away')
+        start = AlertRule('start', '^Starting')
+        rules = AlertRules([disk, slow, start])
+
+        lines = ('request took 1500 ms\n'
+                 'write failed: No space left on device\n'
+                 'request took 12 ms\n'
+                 'Starting over\n'
+                 'not Starting\n'
+                 'request took 2500 ms, No space left')
+        self.assertEquals(rules.match(lines), { disk: 'request took 2500 ms, No space left',
+                                                slow: 'request took 2500 ms, No space left',
+                                                start: 'Starting over' })
+        # Rules that don't start with a literal are searched apart
+        self.assertEquals([ len(batch) for regex, batch in rules.combined ], [2, 1])
+        self.assertEquals(rules.match('all good'), {})
+
+    def test_flags_only_apply_to_their_rule(self):
+        verbose = AlertRule('verbose', '(?x) out \s of \s memory')
+        disk = AlertRule('disk', 'No space left')
+        rules = AlertRules([verbose, disk])
+        self.assertEquals(rules.match('No space left\nout of memory'),
+                          { disk: 'No space left', verbose: 'out of memory' })
+
+    def test_backreferences_only_apply_to_their_rule(self):
+        a = AlertRule('a', r'x(a)\1')
+        b = AlertRule('b', r'y(b)\1')
+        c = AlertRule('c', r'(?P<word>z+) (?P=word)')
+        rules = AlertRules([a, b, c])
+        self.assertEquals(rules.match('hello ybb world\nzz zz'), { b: 'hello ybb world',
+                                                                  c: 'zz zz' })
+        self.assertEquals([ len(batch) for regex, batch in rules.combined ], [1, 1, 1])
+
+    def test_character_classes_are_not_joined_with_literals(self):
+        disk = AlertRule('disk', 'No space left')
+        error = AlertRule('error', '[Ee]rror')
+        rules = AlertRules([disk, error])
+        self.assertEquals([ batch for regex, batch in rules.combined ], [[disk], [error]])
+        self.assertEquals(rules.match('Error: No space left'), { disk: 'Error: No space left',
+                                                                error: 'Error: No space left' })
+
+    def test_rules_matching_the_empty_string(self):
+        trailing = AlertRule('trailing', r'\s*$')
+        optional = AlertRule('optional', '(?:disk full)?')
+        rules = AlertRules([trailing, optional, AlertRule('x', 'x*')])
+        self.assertEquals(len(rules.match('one\ntwo')), 3)
+        self.assertEquals(rules.match('one\ntwo')[trailing], 'two')
+        self.assertEquals(rules.match('')[optional], '')
+
+    def test_unknown_show(self):
+        self.assertRaises(ValueError, AlertRule, 'disk', 'No space left', show='xa')
+        self.assertRaises(ValueError, AlertRule, 'disk', 'No space left', show='')
+
+    def test_many_rules_with_groups(self):
+        rules = AlertRules([ AlertRule('rule%d' % i, '(error) (%d)$' % i) for i in range(150) ])
+        self.assertTrue(len(rules.combined) > 1)
+        matches = rules.match('error 3\nerror 149\nerror 1000')
+        self.assertEquals(sorted([ rule.name for rule in matches ]), ['rule149', 'rule3'])
+
+class LogAlertTest(BaseTest):
+
+    def setUp(self):
+        super(LogAlertTest, self).setUp()
+        self.logfile = '/tmp/jabber_test/test.log'
+        self.fh = open(self.logfile, 'w')
+        self.rules = AlertRules([AlertRule('disk', 'No space left', timeout=60),
+                                 AlertRule('slow', 'took too long', show='away')])
+
+    def write(self, line):
+        self.fh.write(line + '\n')
+        self.fh.flush()
+
+    def test_most_severe_alert_is_set(self):
+        self.set_date('2011-09-21 01:05:20')
+        log = Log(self.logfile, alerts=self.rules)
+        self.assertEquals(log.alert, None)
+
+        self.write('2011-09-21 01:05:10,000 - app - INFO - request took too long')
+        log.flush()
+        self.assertEquals(log.alert.show, 'away')
+        self.assertEquals(log.alert.message, 'request took too long')
+
+        self.write('2011-09-21 01:05:11,000 - app - WARNING - No space left on device')
+        self.write('2011-09-21 01:05:12,000 - app - INFO - request took too long')
+        log.flush()
+        self.assertEquals(log.alert.show, 'dnd')
+        self.assertEquals(log.alert.message, 'No space left on device')
+        self.assertEquals(log.error, None)
+
+        # Each alert expires after the timeout of its rule
+        self.set_date('2011-09-21 01:06:12')
+        self.assertEquals(log.alert.show, 'away')
+
+    def test_alerts_set_bot_status(self):
+        fake_logger = fudge.Fake('logger', callable=True).returns_fake().is_a_stub()
+        logger_patch = fudge.patch_object(Bot, '_get_logger', fake_logger)
+        try:
+            bot = Bot('user@server', 'pass')
+        finally:
+            logger_patch.restore()
+
+        self.set_date('2011-09-21 01:05:20')
+        bot.logs['test'] = Log(self.logfile, alerts=self.rules)
+        bot.status = lambda: ('', 'Ok')
+
+        self.write('2011-09-21 01:05:10,000 - app - INFO - request took too long')
+        bot.logs['test'].flush()
+        bot.set_state()
+        self.assertEquals(bot.status_show, 'away')
+        self.assertEquals(bot.status_msg, '2011-09-21 01:05:10 test: request took too long')
+
+        # A more severe status is kept
+        bot.status = lambda: ('dnd', 'High load')
+        bot.set_state()
+        self.assertEquals(bot.status_show, 'dnd')
+        self.assertEquals(bot.status_msg, '2011-09-21 01:05:10 test: request took too long')
+
+        self.write('2011-09-21 01:05:11,000 - app - ERROR - failed')
+        bot.logs['test'].flush()
+        bot.status = lambda: ('', 'Ok')
+        bot.set_state()
+        self.assertEquals(bot.status_show, 'dnd')
+        self.assertEquals(bot.status_msg, '2011-09-21 01:05:11 test: failed')
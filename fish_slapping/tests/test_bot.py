@@ -345,7 +345,56 @@ class BotTest(BaseTest):
         bot.cycle()
         self.assertEquals(self.count, 5)
 
+    def test_only_logs_that_changed_are_asked_for_errors(self):
+        asked = []
+        class CountingLog(Log):
+            @property
+            def error(self):
+                asked.append(self.name)
+                return super(CountingLog, self).error
 
+        bot = Bot('user@server', 'pass')
+        bot.logs = dict(('log%d' % i, CountingLog('/tmp/jabber_test/log%d.log' % i,
+                                                  error_timeout=60))
+                        for i in range(10))
+        bot.status = lambda: ('', 'Ok')
+
+        self.set_date('2011-09-21 01:00:03')
+        bot.set_state()
+        self.assertEquals(len(asked), 10)
+        del asked[:]
+        bot.set_state()
+        self.assertEquals(asked, [])
+
+        open('/tmp/jabber_test/log3.log', 'w').write(
+            '2011-09-21 01:00:02,854 - log3 - ERROR - Error 01\n')
+        for log in bot.logs.values():
+            log.flush()
+        bot.set_state()
+        self.assertEquals(asked, ['log3'])
+        self.assertEquals(bot.status_msg, '2011-09-21 01:00:02 log3: Error 01')
+        self.assertEquals(bot.status_show, 'dnd')
+
+        # Asked again when the error may have expired
+        del asked[:]
+        self.set_date('2011-09-21 01:01:02')
+        bot.set_state()
+        self.assertEquals(asked, [])
+        self.set_date('2011-09-21 01:01:03')
+        bot.set_state()
+        self.assertEquals(asked, ['log3'])
+        self.assertEquals(bot.status_msg, '2011-09-21 01:00:03 Ok')
+        self.assertEquals(bot.status_show, '')
+
+        # Removed logs are not shown
+        open('/tmp/jabber_test/log5.log', 'w').write(
+            '2011-09-21 01:01:02,854 - log5 - ERROR - Error 02\n')
+        bot.logs['log5'].flush()
+        bot.set_state()
+        self.assertEquals(bot.status_msg, '2011-09-21 01:01:02 log5: Error 02')
+        del bot.logs['log5']
+        bot.set_state()
+        self.assertEquals(bot.status_msg, '2011-09-21 01:00:03 Ok')
 
 
 if __name__ == "__main__":
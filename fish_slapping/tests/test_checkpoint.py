@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+from fish_slapping.tests import BaseTest
+from fish_slapping import Log, CheckpointStore
+
+class CheckpointTest(BaseTest):
+
+    def setUp(self):
+        super(CheckpointTest, self).setUp()
+        self.store = CheckpointStore('/tmp/jabber_test/checkpoint.db')
+
+    def tearDown(self):
+        self.store.close()
+        super(CheckpointTest, self).tearDown()
+
+    def test_restarted_log_resumes_from_checkpoint(self):
+        filename = '/tmp/jabber_test/basic.log'
+        self.set_date('2011-09-21 01:00:10')
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                                  '2011-09-21 01:00:02,854 - basic - ERROR - Line 02\n' +
+                                  '2011-09-21 01:00:03,854 - basic - INFO - Line 03\n' +
+                                  '2011-09-21 01:00:04,854 - basic - INFO - Partial')
+
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+        self.assertEquals(log.status.message, 'Line 03')
+        self.assertEquals(log.error.message, 'Line 02')
+
+        # Bot is stopped, log keeps being written
+        open(filename, 'a').write(' line 04\n' +
+                                  '2011-09-21 01:00:05,854 - basic - DEBUG - Line 05\n')
+
+        # Nothing before the checkpoint is read again
+        flushed = []
+        class RestartedLog(Log):
+            def flush(self):
+                flushed.append(super(RestartedLog, self).flush())
+                return flushed[-1]
+
+        log = RestartedLog(filename, error_timeout=120, checkpoint=self.store)
+        self.assertEquals(flushed, ['2011-09-21 01:00:04,854 - basic - INFO - Partial line 04\n' +
+                                    '2011-09-21 01:00:05,854 - basic - DEBUG - Line 05'])
+        self.assertEquals(log.status.time, '2011-09-21 01:00:04')
+        self.assertEquals(log.status.message, 'Partial line 04')
+        self.assertEquals(log.error.time, '2011-09-21 01:00:02')
+        self.assertEquals(log.error.message, 'Line 02')
+
+    def test_expired_error_is_not_restored(self):
+        filename = '/tmp/jabber_test/basic.log'
+        self.set_date('2011-09-21 01:00:10')
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - ERROR - disk full\n')
+        log = Log(filename, error_timeout=3600, checkpoint=self.store)
+        self.assertEquals(log.error.message, 'disk full')
+
+        # Restarted a day and five minutes later
+        self.set_date('2011-09-22 01:05:10')
+        log = Log(filename, error_timeout=3600, checkpoint=self.store)
+        self.assertEquals(log._error, None)
+        self.assertEquals(log.error, None)
+
+    def test_checkpoint_is_ignored_if_log_was_rotated(self):
+        filename = '/tmp/jabber_test/basic.log'
+        self.set_date('2011-09-21 01:00:10')
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - ERROR - Line 01\n')
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+        self.assertEquals(log.error.message, 'Line 01')
+
+        os.rename(filename, filename + '.1')
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 02\n' +
+                                  '2011-09-21 01:00:01,854 - basic - INFO - Line 03\n')
+
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+        self.assertTrue(not log.error)
+        self.assertEquals(log.status.message, 'Line 03')
+
+    def test_checkpoint_is_in_new_file_while_rotated_lines_are_left(self):
+        filename = '/tmp/jabber_test/basic.log'
+        self.set_date('2011-09-21 01:00:30')
+        open(filename, 'w').close()
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+                  for i in range(20) ]
+        open(filename, 'a').write('\n'.join(lines) + '\n')
+        os.rename(filename, filename + '.1')
+        open(filename, 'w').write('2011-09-21 01:00:21,854 - basic - INFO - Line 21\n')
+
+        self.assertEquals(log.flush(max_lines=5), '\n'.join(lines[:5]))
+        self.assertEquals(self.store.load(filename)[1], 0)
+
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+        self.assertEquals(log.status.message, 'Line 21')
+
+    def test_negative_checkpoint_is_ignored(self):
+        filename = '/tmp/jabber_test/basic.log'
+        self.set_date('2011-09-21 01:00:10')
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n')
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+
+        self.store.save(filename, log.inode, -655, None, None)
+        log = Log(filename, error_timeout=120, checkpoint=self.store)
+        self.assertEquals(log.status.message, 'Line 01')
+
+    def test_checkpoint_of_each_log_is_kept(self):
+        self.set_date('2011-09-21 01:00:10')
+
+        open('/tmp/jabber_test/first.log', 'w').write(
+            '2011-09-21 01:00:01,854 - first - INFO - First\n')
+        open('/tmp/jabber_test/secnd.log', 'w').write(
+            '2011-09-21 01:00:01,854 - secnd - INFO - Second\n')
+        Log('/tmp/jabber_test/first.log', checkpoint=self.store)
+        Log('/tmp/jabber_test/secnd.log', checkpoint=self.store)
+
+        inode, offset, status, error = self.store.load('/tmp/jabber_test/first.log')
+        self.assertEquals(offset, 47)
+        self.assertEquals(status[0], 'First')
+        self.assertEquals(error, None)
+        inode, offset, status, error = self.store.load('/tmp/jabber_test/secnd.log')
+        self.assertEquals(status[0], 'Second')
+
+        self.assertEquals(self.store.load('/tmp/jabber_test/other.log'), None)
@@ -17,8 +17,9 @@
 #
 
 
-import xmpp, fudge, os
+import xmpp, fudge, os, threading, datetime
 from fish_slapping import Bot
+from fish_slapping.scheduler import Scheduler, ThreadPool
 
 def fake_bot():
     tmp_log = '/tmp/fish-slapping-test-delme.log'
@@ -133,3 +134,213 @@ def test_help():
     
     
     
+
+def test_big_bursts_are_streamed_in_bounded_messages():
+    bot, replies = fake_bot()
+    bot.message_size = 200
+    bot.flush_max_bytes = 500
+
+    message = xmpp.Message('user@server', 'show fish-slapping 0', frm='peer@server')
+    bot.message_callback(None, message)
+    bot.flush_logs()
+
+    for i in range(20):
+        bot.logger.info('Line number %02d of a big burst' % i)
+
+    bot.flush_logs()
+    assert len(replies) > 1
+    assert 'Line number 00' in replies[0].getBody()
+    assert 'Line number 19' not in replies[-1].getBody()
+
+    # Rest of burst is sent in next cycles
+    cycles = 1
+    while 'Line number 19' not in replies[-1].getBody():
+        bot.flush_logs()
+        cycles += 1
+        assert cycles < 10
+    assert max([ len(reply.getBody()) for reply in replies ]) < 300
+    body = ''.join([ reply.getBody() for reply in replies ])
+    for i in range(20):
+        assert body.count('Line number %02d of' % i) == 1
+
+def test_commands_in_thread_pool_time_out_and_are_limited():
+    bot, replies = fake_bot()
+    now = [1000.0]
+    bot.scheduler = Scheduler(clock=lambda: now[0])
+    bot.scheduler.running = True
+    bot.command_pool = ThreadPool(bot.scheduler, 4)
+
+    released = threading.Event()
+    def slow(sender, msg):
+        released.wait(5)
+        return 'too late'
+    bot.commands['slow'] = slow
+    bot.commands['hello'] = lambda sender, msg: 'Hello back'
+
+    message = xmpp.Message('user@server', 'slow', frm='peer@server')
+    bot.message_callback(None, message)
+    bot.message_callback(None, message)
+    # Only 2 calls of each command at the same time
+    bot.message_callback(None, message)
+    assert [reply.getBody() for reply in replies] == ['Command slow is busy, try again later']
+
+    # Other commands are still answered
+    bot.message_callback(None, xmpp.Message('user@server', 'hello', frm='peer@server'))
+    while len(replies) < 2:
+        bot.scheduler.run_once()
+    assert replies[-1].getBody() == 'Hello back'
+
+    now[0] += 30
+    bot.scheduler.run_once()
+    assert [reply.getBody() for reply in replies[2:]] == ['Command slow timed out'] * 2
+
+    released.set()
+    while bot.running_commands['slow']:
+        bot.scheduler.run_once()
+    bot.command_pool.close()
+    bot.scheduler.close()
+
+    # Late responses are not sent
+    assert len(replies) == 4
+    stats = bot.command_stats['slow']
+    assert stats.calls == 2
+    assert stats.timeouts == 2
+    assert bot.command_stats['hello'].calls == 1
+
+    bot.scheduler = None
+    bot.message_callback(None, xmpp.Message('user@server', 'stats', frm='peer@server'))
+    assert 'slow: 2 calls' in replies[-1].getBody()
+    assert 'hello: 1 calls' in replies[-1].getBody()
+
+def test_messages_are_coalesced_in_send_window():
+    bot, replies = fake_bot()
+    bot.outbox.window = bot.send_window = 1
+
+    message = xmpp.Message('user@server', 'show fish-slapping 0', frm='peer@server')
+    bot.message_callback(None, message)
+    bot.flush_logs()
+
+    bot.logger.info('First message')
+    bot.flush_logs()
+    bot.logger.info('Second message')
+    bot.flush_logs()
+    assert len(replies) == 0
+    assert len(bot.outbox) == 2
+
+    bot.outbox.drain(force=True)
+    assert len(replies) == 1
+    assert 'First message' in replies[0].getBody()
+    assert 'Second message' in replies[0].getBody()
+
+def test_noisy_streams_are_rate_limited():
+    bot, replies = fake_bot()
+    bot.stream_max_lines = 5
+
+    message = xmpp.Message('user@server', 'show fish-slapping 0', frm='peer@server')
+    bot.message_callback(None, message)
+    bot.flush_logs()
+
+    for i in range(20):
+        bot.logger.info('Noisy line %02d' % i)
+    bot.flush_logs()
+    assert len(replies) == 1
+    assert 'Noisy line 04' in replies[0].getBody()
+    assert 'Noisy line 05' not in replies[0].getBody()
+
+    session = bot.logs['fish-slapping'].session.sessions['peer@server'][-1]
+    session.last_summary -= datetime.timedelta(0, session.SUMMARY_INTERVAL)
+    bot.flush_logs()
+    assert replies[-1].getBody() == '--- 15 lines suppressed'
+
+def test_show_filters_lines():
+    bot, replies = fake_bot()
+
+    message = xmpp.Message('user@server', 'show fish-slapping 0 level warn grep disk|memory',
+                           frm='peer@server')
+    bot.message_callback(None, message)
+    bot.flush_logs()
+
+    bot.logger.info('disk is fine')
+    bot.logger.warn('disk is almost full')
+    bot.logger.error('network is down')
+    bot.logger.error('out of memory')
+    bot.flush_logs()
+    assert len(replies) == 1
+    body = replies[0].getBody()
+    assert 'disk is almost full' in body
+    assert 'out of memory' in body
+    assert 'disk is fine' not in body
+    assert 'network' not in body
+
+    message = xmpp.Message('user@server', 'show fish-slapping level', frm='peer@server')
+    bot.message_callback(None, message)
+    assert replies[-1].getBody() == 'Missing value of level'
+
+    message = xmpp.Message('user@server', 'show fish-slapping grep (', frm='peer@server')
+    bot.message_callback(None, message)
+    assert replies[-1].getBody().startswith('Invalid expression (')
+
+def test_show_since_time():
+    bot, replies = fake_bot()
+    tmp_log = '/tmp/fish-slapping-test-delme.log'
+    logfile = open(tmp_log, 'a')
+    for hour in range(24):
+        logfile.write('2011-09-21 %02d:30:00,000 - test - INFO - Hour %d\n' % (hour, hour))
+    logfile.close()
+    bot.flush_logs()
+
+    now = datetime.datetime(2011, 9, 21, 23, 45, 0)
+    patch = fudge.patch_object(datetime.datetime, 'now',
+                               fudge.Fake('now', callable=True).returns(now))
+    try:
+        message = xmpp.Message('user@server', 'show fish-slapping since 21:00', frm='peer@server')
+        bot.message_callback(None, message)
+        bot.flush_logs()
+        assert replies[-1].getBody().strip().split('\n')[0].endswith('Hour 21')
+        assert 'Hour 20' not in replies[-1].getBody()
+
+        message = xmpp.Message('user@server', 'show fish-slapping last 2h', frm='peer@server')
+        bot.message_callback(None, message)
+        bot.flush_logs()
+        assert replies[-1].getBody().strip().split('\n')[0].endswith('Hour 22')
+
+        message = xmpp.Message('user@server', 'show fish-slapping last 2x', frm='peer@server')
+        bot.message_callback(None, message)
+        assert replies[-1].getBody() == 'Invalid time, use a number followed by s, m, h or d'
+
+        message = xmpp.Message('user@server', 'show fish-slapping since 25', frm='peer@server')
+        bot.message_callback(None, message)
+        assert replies[-1].getBody() == 'Invalid time, use HH:MM'
+    finally:
+        patch.restore()
+
+def test_show_serves_recent_lines_from_memory():
+    bot, replies = fake_bot()
+    log = bot.logs['fish-slapping']
+    message = xmpp.Message('user@server', 'show fish-slapping 0', frm='peer@server')
+    bot.message_callback(None, message)
+
+    for i in range(10):
+        bot.logger.info('Line number %d' % i)
+    bot.flush_logs()
+    assert len(replies) == 1
+
+    def rewind(*args, **kwargs):
+        raise AssertionError('log rewound')
+    log.rewind = rewind
+    message = xmpp.Message('user@server', 'show fish-slapping 3', frm='other@server')
+    bot.message_callback(None, message)
+    # The line logged for the command went to the first session only
+    assert len(replies) == 3
+    assert 'show fish-slapping 3' in replies[1].getBody()
+    assert replies[2].getTo() == 'other@server'
+    lines = replies[2].getBody().strip().split('\n')
+    assert len(lines) == 3
+    assert lines[0].endswith('Line number 8')
+    assert lines[-1].endswith('show fish-slapping 3')
+
+    bot.logger.info('Line number 10')
+    bot.flush_logs()
+    assert len(replies) == 5
+    assert replies[3].getBody().strip().endswith('Line number 10')
+    assert replies[4].getBody().strip().endswith('Line number 10')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime
+from fish_slapping.tests import BaseTest
+
+from fish_slapping import History, Log
+
+def line(i):
+    return '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+
+class HistoryTest(BaseTest):
+
+    def setUp(self):
+        super(HistoryTest, self).setUp()
+        self.parse_line = Log('/tmp/jabber_test/basic.log').parse_line
+
+    def test_last_entries_are_found_across_blocks(self):
+        history = History()
+        history.add('\n'.join([ line(1), line(2), 'traceback of Line 02' ]))
+        history.add('more of Line 02')
+        history.add(line(3))
+
+        self.assertEquals(history.last(0, self.parse_line), '')
+        self.assertEquals(history.last(1, self.parse_line), line(3))
+        self.assertEquals(history.last(2, self.parse_line),
+                          '\n'.join([ line(2), 'traceback of Line 02', 'more of Line 02', line(3) ]))
+        self.assertEquals(history.last(4, self.parse_line), None)
+
+    def test_entries_since_a_time(self):
+        history = History()
+        history.add('\n'.join([ line(1), line(2), 'traceback of Line 02', line(3) ]))
+
+        since = lambda second: history.since(datetime.datetime(2011, 9, 21, 1, 0, second),
+                                             self.parse_line)
+        self.assertEquals(since(3), '')
+        self.assertEquals(since(2), line(3))
+        self.assertEquals(since(1), '\n'.join([ line(2), 'traceback of Line 02', line(3) ]))
+        # Line 01 may not be the first one
+        self.assertEquals(since(0), None)
+
+    def test_oldest_lines_are_dropped(self):
+        history = History(max_lines=3, max_bytes=1000)
+        history.add('\n'.join([ line(1), line(2), line(3), line(4) ]))
+        self.assertEquals(len(history), 3)
+        self.assertEquals(history.last(3, self.parse_line), '\n'.join([ line(2), line(3), line(4) ]))
+        # Blocks are dropped whole
+        history.add(line(5))
+        self.assertEquals(len(history), 1)
+        self.assertEquals(history.last(1, self.parse_line), line(5))
+        self.assertEquals(history.last(2, self.parse_line), None)
+
+        # Lines have 48 bytes, with the line break 49
+        history = History(max_lines=10, max_bytes=120)
+        history.add('\n'.join([ line(1), line(2), line(3) ]))
+        self.assertEquals(history.bytes, 98)
+        self.assertEquals(history.last(2, self.parse_line), '\n'.join([ line(2), line(3) ]))
+        history.add(line(4) + '\n' + line(5) + '\n' + line(6))
+        self.assertEquals(len(history), 2)
+        self.assertEquals(history.last(2, self.parse_line), '\n'.join([ line(5), line(6) ]))
+
+        # A line bigger than max_bytes leaves nothing
+        history.add('x' * 200)
+        self.assertEquals(len(history), 0)
+        self.assertEquals(history.bytes, 0)
+
+    def test_big_burst_keeps_only_the_last_lines(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename, recent_lines=1000)
+        logfile = open(filename, 'w')
+        lines = 0
+        while logfile.tell() + 1000 * 49 <= 16 * 1024 * 1024:
+            logfile.write('\n'.join([ line(i % 60) for i in range(lines, lines + 1000) ]) + '\n')
+            lines += 1000
+        logfile.close()
+
+        log.flush(max_bytes=16 * 1024 * 1024)
+        self.assertEquals(len(log.history), 1000)
+        self.assertEquals(log.history.bytes, 1000 * 49)
+        self.assertTrue(len(log.history.data) <= log.history.max_bytes)
+        self.assertEquals(log.recent(2), '\n'.join([ line((lines - 2) % 60), line((lines - 1) % 60) ]))
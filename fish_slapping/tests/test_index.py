@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+from fish_slapping.tests import BaseTest
+
+from fish_slapping import Log, TimeIndex
+
+class TimeIndexTest(BaseTest):
+
+    def setUp(self):
+        super(TimeIndexTest, self).setUp()
+        self.filename = '/tmp/jabber_test/basic.log'
+
+    def write_minutes(self, minutes, mode = 'a'):
+        logfile = open(self.filename, mode)
+        for minute in minutes:
+            logfile.write('2011-09-21 %02d:%02d:00,000 - basic - INFO - Minute %d\n' %
+                          (minute / 60, minute % 60, minute))
+            if minute % 7 == 0:
+                logfile.write('continuation of minute %d\n' % minute)
+        logfile.close()
+
+    def test_index_is_kept_as_log_is_flushed(self):
+        self.set_date('2011-09-21 10:00:05')
+        index = TimeIndex('/tmp/jabber_test/basic.idx', interval=1024)
+        log = Log(self.filename, index=index)
+        self.assertEquals(index.offsets, [])
+
+        self.write_minutes(range(300))
+        log.flush()
+        self.assertTrue(len(index.offsets) > 10)
+        self.assertEquals(index.offsets[0], 0)
+        # Each entry is about interval bytes after the one before
+        for before, after in zip(index.offsets, index.offsets[1:]):
+            self.assertTrue(1024 <= after - before < 1024 + 100)
+        self.assertEquals(index.times, sorted(index.times))
+
+        # Index is loaded from file
+        saved = TimeIndex('/tmp/jabber_test/basic.idx', interval=1024)
+        self.assertEquals(saved.inode, log.inode)
+        self.assertEquals(saved.offsets, index.offsets)
+        self.assertEquals(saved.times, index.times)
+
+    def test_rewind_by_time_uses_index(self):
+        self.set_date('2011-09-21 10:00:05')
+        self.write_minutes(range(600))
+
+        log = Log(self.filename, index=TimeIndex('/tmp/jabber_test/basic.idx', interval=1024))
+        searched = []
+        first_entry = log._first_entry
+        def counting_first_entry(pos, end):
+            searched.append(pos)
+            return first_entry(pos, end)
+        log._first_entry = counting_first_entry
+
+        unindexed = Log(self.filename)
+        unindexed_searched = []
+        unindexed_first_entry = unindexed._first_entry
+        def counting_unindexed_first_entry(pos, end):
+            unindexed_searched.append(pos)
+            return unindexed_first_entry(pos, end)
+        unindexed._first_entry = counting_unindexed_first_entry
+        dtimes = [605, 3605, 20000, 36005, 36065, 0]
+        for dtime in dtimes:
+            log.rewind(dtime=dtime)
+            unindexed.rewind(dtime=dtime)
+            self.assertEquals(log.pointer, unindexed.pointer)
+        log.rewind(dtime=605)
+        self.assertEquals(log.flush().split('\n')[0],
+                          '2011-09-21 09:51:00,000 - basic - INFO - Minute 591')
+        # Log is read from the entry of the index, not searched
+        self.assertEquals(searched, [])
+        self.assertTrue(unindexed_searched)
+
+    def test_index_is_rebuilt_after_rotation(self):
+        self.set_date('2011-09-21 10:00:05')
+        self.write_minutes(range(300))
+        index = TimeIndex('/tmp/jabber_test/basic.idx', interval=1024)
+        log = Log(self.filename, index=index)
+        inode = index.inode
+
+        os.rename(self.filename, self.filename + '.1')
+        self.write_minutes(range(580, 600), 'w')
+        log.flush()
+        self.assertNotEquals(index.inode, inode)
+        self.assertEquals(index.offsets[0], 0)
+        self.assertTrue(index.offsets[-1] < os.path.getsize(self.filename))
+
+        log.rewind(dtime=605)
+        self.assertEquals(log.flush().split('\n')[0],
+                          '2011-09-21 09:51:00,000 - basic - INFO - Minute 591')
+
+    def test_index_is_kept_next_to_log_or_in_directory(self):
+        self.assertEquals(TimeIndex.for_log(self.filename).path, self.filename + '.idx')
+        self.assertEquals(TimeIndex.for_log(self.filename, '/tmp/jabber_test/cache').path,
+                          '/tmp/jabber_test/cache/tmp_jabber_test_basic.log.idx')
+
+        log = Log(self.filename, index=True)
+        self.assertEquals(log.index.path, self.filename + '.idx')
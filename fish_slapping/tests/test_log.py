@@ -16,9 +16,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import os
+import os, datetime
 from fish_slapping.tests import BaseTest
-from fish_slapping import Log
+from fish_slapping import Log, LineBuffer, LogRecord, Error
 
 class LogTest(BaseTest):
 
@@ -371,3 +371,451 @@ class LogTest(BaseTest):
         self.assertEquals(log.status.time, '2011-09-21 01:05:17')
         self.assertEquals(log.status.message, 'Line 07')
 
+
+    def test_rewind_reads_backwards_across_blocks(self):
+        self.set_date('2011-09-21 10:00:05')
+
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+        # Small blocks, so that lines are split among several reads
+        log.BLOCK_SIZE = 7
+
+        content = ('2011-09-21 06:00:01,854 - basic - INFO - Line 06\n' +
+                   '2011-09-21 07:00:01,854 - basic - INFO - Line 07\n' +
+                   '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n' +
+                   'this is a second line of same log line\n' +
+                   '\n' +
+                   '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                   '2011-09-21 10:00:01,854 - basic - INFO - Line 10\n'
+                   )
+        open(filename, 'w').write(content)
+
+        log.flush()
+        self.assertEquals(log.flush(), '')
+
+        log.rewind(2)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10')
+
+        log.rewind(dtime=7205)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n' +
+                          'this is a second line of same log line\n' +
+                          '\n' +
+                          '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10')
+
+        log.rewind(10)
+        self.assertEquals(log.flush(), content.strip())
+
+    def test_rewind_counts_last_line_without_line_break(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                                  '2011-09-21 02:00:01,854 - basic - INFO - Line 02')
+        log.flush()
+
+        log.rewind(1)
+        self.assertEquals(log.pointer, len('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n'))
+
+    def test_rewind_by_time_can_scan_unsorted_logs(self):
+        self.set_date('2011-09-21 10:00:05')
+
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+        log.SORTED = False
+
+        content = ('2011-09-21 07:00:01,854 - basic - INFO - Line 07\n' +
+                   '2011-09-21 10:00:01,854 - basic - INFO - Line 10\n' +
+                   '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n' +
+                   'this is a second line of same log line\n' +
+                   '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                   '2011-09-21 09:30:01,854 - basic - INFO - Line 09b\n'
+                   )
+        open(filename, 'w').write(content)
+        log.flush()
+
+        # Scanning backwards stops at the first old entry
+        log.rewind(dtime=3605)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                          '2011-09-21 09:30:01,854 - basic - INFO - Line 09b')
+
+        log.rewind(dtime=3600 * 24)
+        self.assertEquals(log.flush(), content.strip())
+
+    def test_rewind_by_time_skips_old_first_entry(self):
+        self.set_date('2011-09-21 10:00:05')
+
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        content = ('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                   'this is a second line of same log line\n' +
+                   '2011-09-21 10:00:01,854 - basic - INFO - Line 10\n'
+                   )
+        open(filename, 'w').write(content)
+        log.flush()
+
+        log.rewind(dtime=60)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10')
+
+        log.SORTED = False
+        log.rewind(dtime=60)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10')
+
+    def test_rewind_by_time_bisects_large_logs(self):
+        self.set_date('2011-09-21 10:00:05')
+
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        logfile = open(filename, 'w')
+        for minute in range(600):
+            logfile.write('2011-09-21 %02d:%02d:00,000 - basic - INFO - Minute %d\n' %
+                          (minute / 60, minute % 60, minute))
+            if minute % 7 == 0:
+                logfile.write('continuation of minute %d\n' % minute)
+        logfile.close()
+        log.flush()
+
+        # The window starts at 09:50:05
+        log.rewind(dtime=605)
+        self.assertEquals(log.flush().split('\n')[0],
+                          '2011-09-21 09:51:00,000 - basic - INFO - Minute 591')
+
+        log.SORTED = False
+        log.rewind(dtime=605)
+        self.assertEquals(log.flush().split('\n')[0],
+                          '2011-09-21 09:51:00,000 - basic - INFO - Minute 591')
+
+    def test_parse_line_gives_same_result_as_strptime(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        self.assertEquals(log.parse_line('2011-09-21 01:02:03,854 - basic - ERROR - Message'),
+                          (datetime.datetime(2011, 9, 21, 1, 2, 3), 'ERROR', 'Message'))
+
+        # Cached time of previous line is reused
+        self.assertEquals(log.parse_line('2011-09-21 01:02:03,999 - basic - INFO - Other'),
+                          (datetime.datetime(2011, 9, 21, 1, 2, 3), 'INFO', 'Other'))
+
+        # Formats strptime accepts, but that are not at fixed offsets
+        self.assertEquals(log.parse_line('2011-9-21 1:02:03,854 - basic - INFO - Message'),
+                          (datetime.datetime(2011, 9, 21, 1, 2, 3), 'INFO', 'Message'))
+
+        for line in ['2011-09-21 01:02:03,854 - basic - INFO',
+                     '2011-13-21 01:02:03,854 - basic - INFO - Message',
+                     '2011-09-21 01:02:+3,854 - basic - INFO - Message',
+                     '2011/09/21 01:02:03,854 - basic - INFO - Message',
+                     'this is a second line of same log line']:
+            self.assertRaises(ValueError, log.parse_line, line)
+
+    def test_flush_only_parses_last_error_and_info(self):
+        filename = '/tmp/jabber_test/basic.log'
+
+        class CountingLog(Log):
+            parsed = 0
+            def _parse_time(self, dtime):
+                self.parsed += 1
+                return super(CountingLog, self)._parse_time(dtime)
+
+        log = CountingLog(filename, error_timeout=120)
+        self.set_date('2011-09-21 01:00:10')
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - ERROR - Error 01\n' +
+                                  '2011-09-21 01:00:02,854 - basic - DEBUG - Debug 02\n' +
+                                  '2011-09-21 01:00:03,854 - basic - INFO - Line 03\n' +
+                                  '2011-09-21 01:00:04,854 - basic - ERROR - Error 04\n' +
+                                  'traceback of error - ERROR - not a log line\n' +
+                                  '2011-09-21 01:00:05,854 - basic - INFO - Line 05\n' +
+                                  '2011-09-21 01:00:06,854 - basic - DEBUG - Debug 06\n' +
+                                  '2011-09-21 01:00:07,854 - basic - WARN - Warn 07\n' +
+                                  '2011-09-21 01:00:08,854 - ERROR - INFO - Line 08\n'
+                                  )
+        log.flush()
+
+        self.assertEquals(log.error.time, '2011-09-21 01:00:04')
+        self.assertEquals(log.error.message, 'Error 04')
+        self.assertEquals(log.status.time, '2011-09-21 01:00:08')
+        self.assertEquals(log.status.message, 'Line 08')
+        # Line 08 has the ERROR marker too, so it is parsed by both searches
+        self.assertEquals(log.parsed, 3)
+
+        # Every line is parsed when prefilter is disabled, with same results
+        log.PREFILTER = False
+        log.rewind(20)
+        log._error = log.status = None
+        log.parsed = 0
+        log.flush()
+
+        self.assertEquals(log.error.message, 'Error 04')
+        self.assertEquals(log.status.message, 'Line 08')
+        self.assertEquals(log.parsed, 8)
+
+    def test_rest_of_rotated_log_is_read_before_new_file(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        content = ('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                   '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+
+        # Lines are written just before rotation
+        open(filename, 'a').write('2011-09-21 03:00:01,854 - basic - INFO - Line 03\n' +
+                                  '2011-09-21 04:00:01,854 - basic - INFO - Line 04')
+        os.rename(filename, filename + '.1')
+
+        # New file is already bigger than the old one
+        content = ('2011-09-21 05:00:01,854 - basic - INFO - Line 05\n' +
+                   '2011-09-21 06:00:01,854 - basic - INFO - Line 06\n' +
+                   '2011-09-21 07:00:01,854 - basic - INFO - Line 07\n' +
+                   '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n')
+        open(filename, 'w').write(content)
+
+        self.assertEquals(log.flush(),
+                          '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n' +
+                          '2011-09-21 04:00:01,854 - basic - INFO - Line 04\n' +
+                          content.strip())
+        self.assertEquals(log.status.message, 'Line 08')
+
+        open(filename, 'a').write('2011-09-21 09:00:01,854 - basic - INFO - Line 09\n')
+        self.assertEquals(log.flush(), '2011-09-21 09:00:01,854 - basic - INFO - Line 09')
+
+    def test_rest_of_rotated_log_is_read_up_to_max_bytes(self):
+        filename = '/tmp/jabber_test/basic.log'
+        open(filename, 'w').close()
+        log = Log(filename)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+                  for i in range(10) ]
+        open(filename, 'a').write('\n'.join(lines) + '\n')
+        os.rename(filename, filename + '.1')
+        open(filename, 'w').write('2011-09-21 02:00:00,854 - basic - INFO - New\n')
+
+        max_bytes = 3 * (len(lines[0]) + 1)
+        messages = [ log.flush(max_bytes=max_bytes) ]
+        while log.dirty:
+            self.assertTrue(len(messages) < 10)
+            messages.append(log.flush(max_bytes=max_bytes))
+        self.assertTrue(max([ len(message) for message in messages ]) < max_bytes)
+        self.assertEquals([ line for message in messages for line in message.split('\n') ],
+                          lines + ['2011-09-21 02:00:00,854 - basic - INFO - New'])
+
+    def test_moved_log_is_followed_until_replaced(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n')
+        log.flush()
+
+        os.rename(filename, filename + '.1')
+        open(filename + '.1', 'a').write('2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        self.assertEquals(log.flush(), '2011-09-21 02:00:01,854 - basic - INFO - Line 02')
+
+        open(filename + '.1', 'a').write('2011-09-21 03:00:01,854 - basic - INFO - Line 03\n')
+        open(filename, 'w').write('2011-09-21 04:00:01,854 - basic - INFO - Line 04\n')
+        self.assertEquals(log.flush(),
+                          '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n' +
+                          '2011-09-21 04:00:01,854 - basic - INFO - Line 04')
+
+    def test_flush_can_be_bounded(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                                  '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n' +
+                                  '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n' +
+                                  '2011-09-21 04:00:01,854 - basic - INFO - Line 04\n')
+
+        # Each line has 49 bytes
+        self.assertEquals(log.flush(max_bytes=60),
+                          '2011-09-21 01:00:01,854 - basic - INFO - Line 01')
+        self.assertTrue(log.dirty)
+        self.assertEquals(log.status.message, 'Line 01')
+
+        self.assertEquals(log.flush(max_lines=2),
+                          '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n' +
+                          '2011-09-21 03:00:01,854 - basic - INFO - Line 03')
+        self.assertTrue(log.dirty)
+        self.assertEquals(log.status.message, 'Line 03')
+
+        self.assertEquals(log.flush(max_lines=0), '')
+        self.assertEquals(log.flush(max_bytes=10, max_lines=1),
+                          '2011-09-21 04:00:01,854 - basic - INFO - Line 04')
+        self.assertEquals(log.flush(), '')
+        self.assertFalse(log.dirty)
+
+    def test_buffer_stays_bounded_when_lines_are_bounded(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i % 60, i % 60)
+                  for i in range(4000) ]
+        open(filename, 'w').write('\n'.join(lines) + '\n')
+
+        # Lines have 48 bytes, with the line break 49
+        sent = []
+        for i in range(50):
+            sent += list(log.iterflush(64 * 1024, 1024 * 1024, 10))
+            self.assertTrue(len(log.buffer) <= 64 * 1024)
+        self.assertEquals('\n'.join(sent), '\n'.join(lines[:500]))
+        self.assertTrue(log.dirty)
+
+        while log.dirty:
+            log.flush(max_bytes=1024 * 1024)
+        self.assertEquals(len(log.buffer), 0)
+        # Memory taken for the burst is given back
+        self.assertEquals(len(log.buffer.data), 64 * 1024)
+
+    def test_log_can_be_flushed_in_chunks(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+                  for i in range(10) ]
+        open(filename, 'w').write('\n'.join(lines) + '\n')
+
+        # Lines have 49 bytes, about two per chunk, up to five lines
+        self.assertEquals(list(log.iterflush(100, max_lines=5)),
+                          [ '\n'.join(lines[0:2]), '\n'.join(lines[2:4]), lines[4] ])
+        self.assertTrue(log.dirty)
+
+        # Up to 150 bytes more. Line 05 and part of 06 were already read
+        self.assertEquals(list(log.iterflush(100, max_bytes=150)),
+                          [ '\n'.join(lines[5:8]), lines[8] ])
+        self.assertTrue(log.dirty)
+
+        self.assertEquals(list(log.iterflush()), [ lines[9] ])
+        self.assertFalse(log.dirty)
+        self.assertEquals(list(log.iterflush(100)), [])
+
+    def test_rewind_by_lines_uses_offsets_of_flushed_lines(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename, line_offsets=5)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+                  for i in range(10) ]
+        lines.insert(7, 'second line of Line 06')
+        open(filename, 'w').write('\n'.join(lines) + '\n')
+        list(log.iterflush(100))
+        scanned = Log(filename)
+
+        def reverse_lines(end):
+            raise AssertionError('file read backwards')
+        log._reverse_lines = reverse_lines
+        for n in range(6):
+            log.rewind(n)
+            scanned.rewind(n)
+            self.assertEquals(log.pointer, scanned.pointer)
+            self.assertEquals(log.flush(), scanned.flush())
+        del log._reverse_lines
+
+        # Lines not flushed yet are read backwards, the others come from the ring
+        open(filename, 'a').write(lines[3] + '\n' + lines[4])
+        for n in range(9):
+            log.rewind(n)
+            scanned.rewind(n)
+            self.assertEquals(log.pointer, scanned.pointer)
+            self.assertEquals(log.flush(), scanned.flush())
+
+    def test_line_offsets_start_over_when_log_is_rotated(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename, line_offsets=10)
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                                  '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        log.flush()
+        open(filename, 'a').write('2011-09-21 03:00:01,854 - basic - INFO - Line 03')
+        os.rename(filename, filename + '.1')
+        open(filename, 'w').write('2011-09-21 04:00:01,854 - basic - INFO - Line 04\n' +
+                                  '2011-09-21 05:00:01,854 - basic - INFO - Line 05\n')
+        log.flush()
+        self.assertEquals(list(log.offsets), [0, 49])
+
+        log.rewind(1)
+        self.assertEquals(log.flush(), '2011-09-21 05:00:01,854 - basic - INFO - Line 05')
+        # Older lines are not in the file anymore
+        log.rewind(3)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 04:00:01,854 - basic - INFO - Line 04\n' +
+                          '2011-09-21 05:00:01,854 - basic - INFO - Line 05')
+
+    def test_rewind_beyond_line_offsets_scans_the_file(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename, line_offsets=3)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+                  for i in range(10) ]
+        open(filename, 'w').write('\n'.join(lines) + '\n')
+        log.flush()
+        self.assertEquals(len(log.offsets), 3)
+
+        log.rewind(3)
+        self.assertEquals(log.flush(), '\n'.join(lines[7:]))
+        log.rewind(6)
+        self.assertEquals(log.flush(), '\n'.join(lines[4:]))
+
+        # Skipping unread lines leaves the ring with the ones flushed after that
+        open(filename, 'a').write(lines[0] + '\n')
+        log.rewind()
+        open(filename, 'a').write(lines[1] + '\n')
+        log.flush()
+        self.assertEquals(list(log.offsets), [ 539 ])
+        log.rewind(2)
+        self.assertEquals(log.flush(), lines[0] + '\n' + lines[1])
+
+    def test_recent_lines_are_kept_once(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = Log(filename, recent_lines=4)
+
+        lines = [ '2011-09-21 01:00:%02d,854 - basic - INFO - Line %02d' % (i, i)
+                  for i in range(6) ]
+        open(filename, 'w').write('\n'.join(lines[:3]) + '\n')
+        log.flush()
+        log.rewind(2)
+        self.assertEquals(log.flush(), '\n'.join(lines[1:3]))
+        self.assertEquals(len(log.history), 3)
+
+        open(filename, 'a').write('\n'.join(lines[3:]) + '\n')
+        log.flush()
+        # The first block is dropped whole to make room
+        self.assertEquals(log.recent(3), '\n'.join(lines[3:]))
+        self.assertEquals(log.recent(4), None)
+
+    def test_parsed_lines_can_be_kept_as_records(self):
+        log = Log('/tmp/jabber_test/basic.log')
+
+        record = log.parse_record('2011-09-21 01:00:01,854 - basic - ERROR - Disk full')
+        self.assertEquals(record, (1316566801, 'ERROR', 'Disk full'))
+        self.assertEquals(record.level, 'ERROR')
+        self.assertEquals(record.tstamp, datetime.datetime(2011, 9, 21, 1, 0, 1))
+        self.assertRaises(AttributeError, setattr, record, 'note', '')
+
+        error = Error('Disk full', record.tstamp)
+        self.assertFalse(hasattr(error, '__dict__'))
+
+    def test_line_buffer_grows_and_keeps_incomplete_line(self):
+        buf = LineBuffer(size=4)
+
+        buf.append('line 1\nline 2\nline')
+        self.assertEquals(len(buf), 18)
+        self.assertTrue(buf.has_lines())
+
+        self.assertEquals(buf.pop_lines(1), 'line 1')
+        self.assertEquals(buf.pop_lines(0), '')
+        self.assertEquals(buf.pop_lines(), 'line 2')
+        self.assertFalse(buf.has_lines())
+        self.assertEquals(buf.pop_lines(), '')
+
+        buf.append(' 3\n\nline 4')
+        self.assertEquals(buf.pop_lines(), 'line 3\n')
+        buf.terminate()
+        buf.terminate()
+        self.assertEquals(buf.pop_lines(), 'line 4')
+        self.assertEquals(len(buf), 0)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+from fish_slapping.tests import BaseTest
+from fish_slapping import MappedLog
+
+class MappedLogTest(BaseTest):
+
+    def test_mapped_log_follows_growing_file(self):
+        filename = '/tmp/jabber_test/basic.log'
+        assert not os.path.exists(filename)
+
+        log = MappedLog(filename)
+        self.assertEquals(log.flush(), '')
+
+        open(filename, 'w').write('')
+        self.assertEquals(log.flush(), '')
+
+        open(filename, 'a').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n')
+        self.assertEquals(log.flush(),
+                          '2011-09-21 01:00:01,854 - basic - INFO - Line 01')
+
+        # A line is only flushed when it's complete
+        open(filename, 'a').write('2011-09-21 02:00:01,854 - basic - INFO')
+        self.assertEquals(log.flush(), '')
+        open(filename, 'a').write(' - Line 02\n' +
+                                  '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n')
+        self.assertEquals(log.flush(),
+                          '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n' +
+                          '2011-09-21 03:00:01,854 - basic - INFO - Line 03')
+        self.assertEquals(log.status.message, 'Line 03')
+
+    def test_mapped_log_is_remapped_when_truncated(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = MappedLog(filename)
+
+        content = ('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                   '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n' +
+                   '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n')
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+
+        # File is rewritten, not appended
+        self.set_date('2011-09-21 04:00:02')
+        content = '2011-09-21 04:00:01,854 - basic - ERROR - Line 04\n'
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+        self.assertEquals(log.error.message, 'Line 04')
+
+    def test_mapped_log_is_reopened_when_rotated(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = MappedLog(filename)
+
+        content = ('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                   '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+
+        os.rename(filename, filename + '.1')
+        self.assertEquals(log.flush(), '')
+
+        content = '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n'
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+
+        open(filename, 'a').write('2011-09-21 04:00:01,854 - basic - INFO - Line 04\n')
+        self.assertEquals(log.flush(),
+                          '2011-09-21 04:00:01,854 - basic - INFO - Line 04')
+
+    def test_rest_of_rotated_mapped_log_is_read_before_new_file(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = MappedLog(filename)
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n')
+        log.flush()
+
+        open(filename, 'a').write('2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        os.rename(filename, filename + '.1')
+        open(filename, 'w').write('2011-09-21 03:00:01,854 - basic - INFO - Line 03\n' +
+                                  '2011-09-21 04:00:01,854 - basic - INFO - Line 04\n')
+
+        self.assertEquals(log.flush(),
+                          '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n' +
+                          '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n' +
+                          '2011-09-21 04:00:01,854 - basic - INFO - Line 04')
+
+    def test_mapped_log_truncated_before_rotation(self):
+        filename = '/tmp/jabber_test/basic.log'
+        log = MappedLog(filename)
+
+        content = ('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                   '2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+
+        open(filename, 'w').close()
+        os.rename(filename, filename + '.1')
+        content = '2011-09-21 03:00:01,854 - basic - INFO - Line 03\n'
+        open(filename, 'w').write(content)
+        self.assertEquals(log.flush(), content.strip())
+        self.assertEquals(log.status.message, 'Line 03')
+
+    def test_mapped_log_can_be_rewinded(self):
+        self.set_date('2011-09-21 10:00:05')
+
+        filename = '/tmp/jabber_test/basic.log'
+        log = MappedLog(filename)
+
+        content = ('2011-09-21 06:00:01,854 - basic - INFO - Line 06\n' +
+                   '2011-09-21 07:00:01,854 - basic - INFO - Line 07\n' +
+                   '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n' +
+                   'this is a second line of same log line\n' +
+                   '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                   '2011-09-21 10:00:01,854 - basic - INFO - Line 10\n'
+                   )
+        open(filename, 'w').write(content)
+        log.flush()
+
+        log.rewind(3)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n' +
+                          'this is a second line of same log line\n' +
+                          '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10')
+
+        # Rewinding after the file grows will map the new content
+        open(filename, 'a').write('2011-09-21 10:00:02,854 - basic - INFO - Line 11\n')
+        log.rewind(dtime=3605)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10\n' +
+                          '2011-09-21 10:00:02,854 - basic - INFO - Line 11')
+
+        log.SORTED = False
+        log.rewind(dtime=7205)
+        self.assertEquals(log.flush(),
+                          '2011-09-21 08:00:01,854 - basic - INFO - Line 08\n' +
+                          'this is a second line of same log line\n' +
+                          '2011-09-21 09:00:01,854 - basic - INFO - Line 09\n' +
+                          '2011-09-21 10:00:01,854 - basic - INFO - Line 10\n' +
+                          '2011-09-21 10:00:02,854 - basic - INFO - Line 11')
+
+    def test_recent_errors_are_found_on_startup(self):
+        filename = '/tmp/jabber_test/basic.log'
+
+        self.set_date('2011-09-21 01:00:10')
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n' +
+                                  '2011-09-21 01:00:04,854 - basic - ERROR - Line 04\n' +
+                                  '2011-09-21 01:00:05,854 - basic - INFO - Line 05\n'
+                                  )
+
+        log = MappedLog(filename, error_timeout=120)
+
+        self.assertEquals(log.error.message, 'Line 04')
+        self.assertEquals(log.status.message, 'Line 05')
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from fish_slapping.tests import BaseTest
+
+from fish_slapping import Outbox
+
+class OutboxTest(BaseTest):
+
+    def setUp(self):
+        super(OutboxTest, self).setUp()
+        self.now = 1000.0
+        self.sent = []
+
+    def outbox(self, window = 0, max_bytes = 64 * 1024):
+        return Outbox(lambda jid, body: self.sent.append((jid, body)),
+                      window=window, max_bytes=max_bytes, clock=lambda: self.now)
+
+    def test_messages_are_sent_right_away_without_window(self):
+        outbox = self.outbox()
+        outbox.put('test1@domain.com', 'hello')
+        outbox.put('test1@domain.com', 'world')
+        self.assertEquals(self.sent, [('test1@domain.com', 'hello'),
+                                      ('test1@domain.com', 'world')])
+        self.assertEquals(len(outbox), 0)
+
+    def test_messages_to_same_jid_are_coalesced_within_window(self):
+        outbox = self.outbox(window=2)
+        outbox.put('test1@domain.com', 'line 1')
+        outbox.put('test2@domain.com', 'other')
+        self.now += 1
+        outbox.put('test1@domain.com', '\nline 2')
+        self.assertEquals(len(outbox), 3)
+
+        outbox.drain()
+        self.assertEquals(self.sent, [])
+
+        self.now += 1
+        outbox.put('test2@domain.com', 'more')
+        outbox.drain()
+        self.assertEquals(self.sent, [('test1@domain.com', 'line 1\nline 2'),
+                                      ('test2@domain.com', 'other\nmore')])
+        self.assertEquals(len(outbox), 0)
+        self.assertEquals(outbox.max_depth, 4)
+        self.assertEquals(outbox.sent, 2)
+        self.assertEquals(outbox.coalesced, 2)
+
+    def test_messages_are_limited_to_max_bytes(self):
+        outbox = self.outbox(window=1, max_bytes=10)
+        outbox.put('test1@domain.com', 'abc')
+        outbox.put('test1@domain.com', 'defg')
+        outbox.put('test1@domain.com', 'hij')
+        # Split at line breaks, or at max_bytes if a line is too long
+        outbox.put('test1@domain.com', 'klm\nnopqrstuvwxyz0123')
+        outbox.drain(force=True)
+        self.assertEquals([ body for jid, body in self.sent ],
+                          ['abc\ndefg', 'hij\nklm', 'nopqrstuvw', 'xyz0123'])
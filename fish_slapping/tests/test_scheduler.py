@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, fudge, threading, xmpp
+from fish_slapping.tests import BaseTest
+
+from fish_slapping import Bot, PollingWatcher
+from fish_slapping.scheduler import Scheduler, ThreadPool
+
+class SchedulerTest(BaseTest):
+
+    def setUp(self):
+        super(SchedulerTest, self).setUp()
+        self.now = 1000.0
+        self.scheduler = Scheduler(clock=lambda: self.now)
+        self.calls = []
+
+    def test_timers_run_on_their_intervals(self):
+        self.scheduler.every(1, lambda: self.calls.append('fast'))
+        self.scheduler.every(5, lambda: self.calls.append('slow'), now=True)
+
+        self.assertEquals(self.scheduler.timeout(), 0)
+        self.scheduler.run_once()
+        self.assertEquals(self.calls, ['slow'])
+        self.assertEquals(self.scheduler.timeout(), 1)
+
+        self.now += 1
+        self.scheduler.run_once()
+        self.assertEquals(self.calls, ['slow', 'fast'])
+
+        # A late timer runs only once
+        self.now += 4.5
+        self.scheduler.run_once()
+        self.assertEquals(self.calls, ['slow', 'fast', 'fast', 'slow'])
+        self.assertEquals(self.scheduler.timeout(), 1)
+
+    def test_cancelled_timers_dont_run(self):
+        timer = self.scheduler.every(1, lambda: self.calls.append('timer'))
+        timer.cancel()
+        self.assertEquals(self.scheduler.timeout(), None)
+
+        self.now += 1
+        self.scheduler.run_once()
+        self.assertEquals(self.calls, [])
+
+    def test_readers_are_called_when_readable(self):
+        rfd, wfd = os.pipe()
+        try:
+            self.scheduler.add_reader(rfd, lambda: self.calls.append(os.read(rfd, 10)))
+            self.scheduler.every(1, lambda: self.calls.append('timer'), now=True)
+
+            self.scheduler.run_once()
+            self.assertEquals(self.calls, ['timer'])
+
+            os.write(wfd, 'data')
+            self.now += 0.5
+            self.scheduler.run_once()
+            self.assertEquals(self.calls, ['timer', 'data'])
+
+            self.scheduler.remove_reader(rfd)
+            os.write(wfd, 'more')
+            self.now += 0.5
+            self.scheduler.run_once()
+            self.assertEquals(self.calls, ['timer', 'data', 'timer'])
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_functions_run_in_threads_call_back_in_loop(self):
+        results = []
+        def fail():
+            raise ValueError('failed')
+
+        self.scheduler.run_in_thread(lambda: threading.current_thread(),
+                                     lambda result, error: results.append((result, error)))
+        self.scheduler.run_in_thread(fail,
+                                     lambda result, error: results.append((result, str(error))))
+        while len(results) < 2:
+            self.scheduler.run_once()
+        self.scheduler.close()
+
+        results.sort(key=lambda result: result[1])
+        self.assertEquals(results[0][1], None)
+        self.assertNotEquals(results[0][0], threading.current_thread())
+        self.assertEquals(results[1], (None, 'failed'))
+
+    def test_threads_finishing_after_close_are_dropped(self):
+        results = []
+        released = threading.Event()
+        thread = self.scheduler.run_in_thread(lambda: released.wait(5),
+                                              lambda result, error: results.append(error))
+        self.scheduler.close()
+        released.set()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+        self.scheduler.call_soon_threadsafe(lambda: results.append('late'))
+        self.assertEquals(list(self.scheduler.pending), [])
+        self.assertEquals(results, [])
+
+    def test_thread_pool_is_bounded(self):
+        released = threading.Event()
+        results = []
+        pool = ThreadPool(self.scheduler, 2)
+
+        for i in range(3):
+            pool.submit(lambda i=i: released.wait(5) and i,
+                        lambda result, error: results.append(result))
+        self.assertEquals(len(pool.threads), 2)
+
+        released.set()
+        while len(results) < 3:
+            self.scheduler.run_once()
+        self.assertEquals(sorted(results), [0, 1, 2])
+        self.assertEquals(len(pool.threads), 2)
+        self.assertEquals(pool.pending, 0)
+
+        pool.close()
+        self.scheduler.close()
+
+class BotRunTest(BaseTest):
+
+    def setUp(self):
+        super(BotRunTest, self).setUp()
+
+        fake_logger = fudge.Fake('logger', callable=True).returns_fake().is_a_stub()
+        self.logger_patch = fudge.patch_object(Bot, '_get_logger', fake_logger)
+
+    def tearDown(self):
+        super(BotRunTest, self).tearDown()
+        self.logger_patch.restore()
+
+    def test_logs_are_flushed_when_watcher_is_readable(self):
+        rfd, wfd = os.pipe()
+        flushes = []
+
+        class Watcher(PollingWatcher):
+            def fileno(self):
+                return rfd
+            def poll(self, logs):
+                flushes.append(os.read(rfd, 10))
+                bot.stop()
+
+        bot = Bot('user@server', 'pass', watcher=Watcher(),
+                  log_path='/tmp/jabber_test/bot.log',
+                  flush_interval=3600, status_interval=3600, expire_interval=3600)
+        bot.connected = True
+        bot.client = fudge.Fake('client').is_a_stub()
+        bot.client.Connection = fudge.Fake('connection').has_attr(_sock=wfd)
+        bot.presence = lambda: None
+
+        try:
+            os.write(wfd, 'changed')
+            bot.run()
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+        self.assertEquals(flushes, ['changed'])
+        self.assertEquals(bot.socket, wfd)
+
+    def test_bot_connects_before_updating_its_state(self):
+        calls = []
+
+        def update_state():
+            calls.append('update_state')
+            bot.stop()
+
+        bot = Bot('user@server', 'pass', watcher=PollingWatcher(),
+                  log_path='/tmp/jabber_test/bot.log', threaded=False)
+        bot.check_connection = lambda: calls.append('check_connection')
+        bot.update_state = update_state
+        bot.run()
+
+        self.assertEquals(calls, ['check_connection', 'update_state'])
+
+    def test_failed_reconnect_drops_the_dead_socket(self):
+        rfd, wfd = os.pipe()
+        calls = []
+
+        def process(timeout):
+            # Disconnected, and the reconnect couldn't connect
+            calls.append(timeout)
+            bot.connected = False
+            bot.finish()
+
+        bot = Bot('user@server', 'pass', watcher=PollingWatcher(),
+                  log_path='/tmp/jabber_test/bot.log')
+        bot.connected = True
+        bot.client = fudge.Fake('client').is_a_stub()
+        bot.client.Process = process
+        bot.scheduler = Scheduler()
+        bot.socket = rfd
+        bot.scheduler.add_reader(rfd, bot._task(bot.process))
+
+        try:
+            os.write(wfd, 'EOF')
+            bot.scheduler.run_once()
+            bot.scheduler.run_once()
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+        self.assertEquals(calls, [0])
+        self.assertEquals(bot.scheduler.readers, {})
+        self.assertEquals(bot.socket, None)
+
+    def test_slow_commands_dont_block_the_bot(self):
+        rfd, wfd = os.pipe()
+        replies = []
+        ticks = []
+        released = threading.Event()
+
+        def slow(sender_id, message):
+            released.wait(5)
+            return 'done %s' % ' '.join(message)
+
+        def presence():
+            ticks.append(True)
+            if len(ticks) == 1:
+                bot.message_callback(None, xmpp.Message(frm='user@server', body='slow command'))
+            elif len(ticks) == 3:
+                # Bot keeps running while command is still running
+                released.set()
+
+        def send(message):
+            replies.append(message.getBody())
+            bot.stop()
+
+        bot = Bot('user@server', 'pass', watcher=PollingWatcher(),
+                  log_path='/tmp/jabber_test/bot.log', status_interval=0.01)
+        bot.connected = True
+        bot.client = fudge.Fake('client').is_a_stub()
+        bot.client.Connection = fudge.Fake('connection').has_attr(_sock=rfd)
+        bot.client.send = send
+        bot.presence = presence
+        bot.commands['slow'] = slow
+
+        try:
+            bot.run()
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+        self.assertEquals(replies, ['done command'])
+        self.assertTrue(len(ticks) >= 3)
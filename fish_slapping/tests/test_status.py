@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time, fudge
+from fish_slapping.tests import BaseTest
+
+from fish_slapping import (Bot, CachedStatus, StatusGroup,
+                           LoadStatus, MemoryStatus, UptimeStatus)
+
+class StatusProviderTest(BaseTest):
+
+    def setUp(self):
+        super(StatusProviderTest, self).setUp()
+        self.now = 1000.0
+        fake_time = fudge.Fake('time', callable=True).calls(lambda: self.now)
+        self.time_patch = fudge.patch_object(time, 'time', fake_time)
+
+    def tearDown(self):
+        super(StatusProviderTest, self).tearDown()
+        self.time_patch.restore()
+
+    def write(self, name, content):
+        path = '/tmp/jabber_test/%s' % name
+        open(path, 'w').write(content)
+        return path
+
+    def test_status_is_cached_for_interval(self):
+        calls = []
+        def uptime():
+            calls.append(True)
+            return '', 'call %d' % len(calls)
+
+        status = CachedStatus(uptime, 60)
+        self.assertEquals(status(), ('', 'call 1'))
+        self.now += 59
+        self.assertEquals(status(), ('', 'call 1'))
+        self.now += 1
+        self.assertEquals(status(), ('', 'call 2'))
+
+    def test_load_status(self):
+        path = self.write('loadavg', '2.50 1.00 0.50 2/73 26446\n')
+        self.assertEquals(LoadStatus(path=path)(), ('away', 'load average: 2.50, 1.00, 0.50'))
+        self.assertEquals(LoadStatus(path=path, away=3)(), ('', 'load average: 2.50, 1.00, 0.50'))
+        self.assertEquals(LoadStatus(path=path, dnd=2)()[0], 'dnd')
+
+    def test_memory_status(self):
+        path = self.write('meminfo', 'MemTotal:        4096000 kB\n'
+                                     'MemFree:          512000 kB\n'
+                                     'MemAvailable:    1024000 kB\n'
+                                     'Buffers:           58680 kB\n')
+        self.assertEquals(MemoryStatus(path=path)(), ('', 'memory: 75% used (3000 of 4000 MB)'))
+        self.assertEquals(MemoryStatus(path=path, away=70, dnd=80)()[0], 'away')
+
+        path = self.write('meminfo', 'MemTotal:        4096000 kB\n'
+                                     'MemFree:          512000 kB\n'
+                                     'Buffers:          256000 kB\n'
+                                     'Cached:           256000 kB\n')
+        self.assertEquals(MemoryStatus(path=path)()[1], 'memory: 75% used (3000 of 4000 MB)')
+
+    def test_uptime_status(self):
+        path = self.write('uptime', '273917.31 1263.23\n')
+        self.assertEquals(UptimeStatus(path=path)(), ('', 'up 3 days, 4:05'))
+
+    def test_group_takes_most_severe_show(self):
+        uptime = UptimeStatus(path=self.write('uptime', '120.5 100.0\n'))
+        load = LoadStatus(path=self.write('loadavg', '4.50 1.00 0.50 2/73 26446\n'))
+        status = StatusGroup(uptime, load)
+        self.assertEquals(status.interval, LoadStatus.INTERVAL)
+        self.assertEquals(status(), ('dnd', 'up 0 days, 0:02, load average: 4.50, 1.00, 0.50'))
+
+    def test_bot_only_refreshes_expired_providers(self):
+        fake_logger = fudge.Fake('logger', callable=True).returns_fake().is_a_stub()
+        logger_patch = fudge.patch_object(Bot, '_get_logger', fake_logger)
+        try:
+            bot = Bot('user@server', 'pass')
+        finally:
+            logger_patch.restore()
+
+        calls = []
+        bot.status = CachedStatus(lambda: calls.append(True) or ('', 'Ok'), 60)
+        bot.scheduler = fudge.Fake('scheduler').provides('run_in_thread').calls(
+            lambda function, callback: callback(function(), None))
+
+        bot.refresh_status()
+        bot.refresh_status()
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(bot.status_result, ('', 'Ok'))
+
+        self.now += 60
+        bot.refresh_status()
+        self.assertEquals(len(calls), 2)
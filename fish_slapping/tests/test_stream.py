@@ -18,7 +18,7 @@
 
 import os
 from fish_slapping.tests import BaseTest
-from fish_slapping import StreamSessionManager
+from fish_slapping import StreamSessionManager, Log
 
 class StreamSessionManagerTest(BaseTest):
 
@@ -167,3 +167,139 @@ class StreamSessionManagerTest(BaseTest):
         self.assertTrue('test2@domain.com' in session.receivers)
         self.assertTrue('test3@domain.com' not in session.receivers)
 
+
+    def test_jid_is_only_expired_when_all_its_sessions_expire(self):
+        self.set_date('2011-09-21 01:05:10')
+
+        session = StreamSessionManager()
+
+        session.add('test1@domain.com', timeout = 10)
+        session.add('test2@domain.com', timeout = 10)
+        session.add('test1@domain.com', timeout = 10)
+        session.add('test1@domain.com', timeout = 30)
+        self.assertEquals(session.receivers, ['test1@domain.com', 'test2@domain.com'])
+
+        # Two of the three sessions of test1 expire
+        self.set_date('2011-09-21 01:05:21')
+        self.assertEquals(session.expire(), ['test2@domain.com'])
+        self.assertEquals(session.receivers, ['test1@domain.com'])
+
+        self.set_date('2011-09-21 01:05:41')
+        self.assertEquals(session.expire(), ['test1@domain.com'])
+        self.assertEquals(session.receivers, [])
+        self.assertEquals(session.expire(), [])
+
+        # Receivers are kept in the order they were added
+        session.add('test2@domain.com')
+        session.add('test1@domain.com')
+        session.add('test2@domain.com')
+        self.assertEquals(session.receivers, ['test2@domain.com', 'test1@domain.com'])
+        session.remove('test2@domain.com')
+        session.remove('test3@domain.com')
+        self.assertEquals(session.receivers, ['test1@domain.com'])
+
+    def test_conditions_are_checked_at_given_interval(self):
+        self.set_date('2011-09-21 01:05:10')
+        self.checks = 0
+        self.active = True
+        def condition():
+            self.checks += 1
+            return self.active
+
+        session = StreamSessionManager(condition_interval = 60)
+        session.add('test1@domain.com', timeout = 30, condition = condition)
+        session.add('test2@domain.com', condition = condition)
+
+        session.expire()
+        self.assertEquals(self.checks, 2)
+
+        self.set_date('2011-09-21 01:05:40')
+        self.active = False
+        self.assertEquals(session.expire(), [])
+        self.assertEquals(self.checks, 2)
+
+        # Timeout does not wait for the interval
+        self.set_date('2011-09-21 01:05:41')
+        self.assertEquals(session.expire(), ['test1@domain.com'])
+        self.assertEquals(self.checks, 2)
+
+        self.set_date('2011-09-21 01:06:10')
+        self.assertEquals(session.expire(), ['test2@domain.com'])
+        self.assertEquals(self.checks, 3)
+
+    def test_sessions_with_timeout_and_condition_expire_once(self):
+        self.set_date('2011-09-21 01:05:10')
+
+        session = StreamSessionManager()
+        session.add('test1@domain.com', timeout = 10, condition = lambda: False)
+        session.add('test1@domain.com', timeout = 20)
+
+        self.set_date('2011-09-21 01:05:21')
+        self.assertEquals(session.expire(), [])
+        self.assertEquals(session.receivers, ['test1@domain.com'])
+
+        # Removed sessions won't expire later
+        session.remove('test1@domain.com')
+        self.set_date('2011-09-21 01:05:31')
+        self.assertEquals(session.expire(), [])
+
+    def test_lines_over_rate_limit_are_suppressed(self):
+        self.set_date('2011-09-21 01:05:10')
+
+        session = StreamSessionManager()
+        session.add('test1@domain.com', max_lines = 3)
+        session.add('test2@domain.com', max_bytes = 10)
+        session.add('test3@domain.com')
+
+        message = 'line 1\nline 2\nline 3\nline 4'
+        self.assertEquals(session.accept('test1@domain.com', message), 'line 1\nline 2\nline 3')
+        self.assertEquals(session.accept('test2@domain.com', message), 'line 1')
+        self.assertEquals(session.accept('test3@domain.com', message), message)
+        self.assertEquals(session.accept('test1@domain.com', 'line 5'), None)
+
+        # Summary is sent every SUMMARY_INTERVAL seconds
+        self.assertEquals(list(session.summaries()), [])
+        self.set_date('2011-09-21 01:05:20')
+        self.assertEquals(list(session.summaries()), [('test1@domain.com', '--- 2 lines suppressed'),
+                                                      ('test2@domain.com', '--- 3 lines suppressed')])
+        self.assertEquals(list(session.summaries()), [])
+
+        # Limit is refilled over time
+        self.assertEquals(session.accept('test1@domain.com', message), 'line 1\nline 2\nline 3')
+        self.set_date('2011-09-21 01:05:21')
+        self.assertEquals(session.accept('test1@domain.com', 'line 5\nline 6'), 'line 5\nline 6')
+
+    def test_suppressed_lines_are_told_when_session_expires(self):
+        self.set_date('2011-09-21 01:05:10')
+
+        session = StreamSessionManager()
+        session.add('test1@domain.com', timeout = 5, max_lines = 1)
+        session.accept('test1@domain.com', 'line 1\nline 2')
+
+        self.set_date('2011-09-21 01:05:16')
+        self.assertEquals(session.expire(), ['test1@domain.com'])
+        self.assertEquals(list(session.summaries()), [('test1@domain.com', '--- 1 lines suppressed')])
+
+    def test_lines_are_filtered_by_level_and_expression(self):
+        parse_level = Log.parse_level.__func__
+        log = type('FakeLog', (object,), { 'prefilter': True })()
+
+        session = StreamSessionManager()
+        session.add('test1@domain.com', level = 'warn', parse_level = lambda line: parse_level(log, line))
+        session.add('test2@domain.com', grep = 'time.*out')
+        session.add('test3@domain.com', level = 'ERROR', grep = 'Trace|db',
+                    parse_level = lambda line: parse_level(log, line))
+
+        message = ('2011-09-21 01:05:10,000 - app - INFO - connected to db\n'
+                   '2011-09-21 01:05:11,000 - app - ERROR - db timed out\n'
+                   'Traceback (most recent call last):\n'
+                   '2011-09-21 01:05:12,000 - app - WARNING - retrying')
+        lines = message.split('\n')
+
+        self.assertEquals(session.accept('test1@domain.com', message), '\n'.join(lines[1:]))
+        self.assertEquals(session.accept('test2@domain.com', message), lines[1])
+        self.assertEquals(session.accept('test3@domain.com', message), '\n'.join(lines[1:3]))
+
+        # Continuation lines go with the entry they belong to
+        self.assertEquals(session.accept('test3@domain.com', 'Traceback again'), None)
+        self.assertEquals(session.accept('test1@domain.com', 'Traceback again'), 'Traceback again')
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, fudge
+from fish_slapping.tests import BaseTest
+from fish_slapping import Log, Bot, InotifyWatcher, PollingWatcher
+
+class InotifyWatcherTest(BaseTest):
+
+    def setUp(self):
+        super(InotifyWatcherTest, self).setUp()
+        try:
+            self.watcher = InotifyWatcher()
+        except (OSError, AttributeError):
+            self.skipTest('inotify is not available')
+
+    def tearDown(self):
+        self.watcher.close()
+        super(InotifyWatcherTest, self).tearDown()
+
+    def test_log_is_dirty_only_when_modified(self):
+        filename = '/tmp/jabber_test/basic.log'
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n')
+        other = Log('/tmp/jabber_test/other.log')
+        log = Log(filename)
+
+        # New logs are always dirty
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+        log.flush()
+
+        self.watcher.poll([log])
+        self.assertFalse(log.dirty)
+
+        open(filename, 'a').write('2011-09-21 02:00:01,854 - basic - INFO - Line 02\n')
+        self.watcher.poll([log, other])
+        self.assertTrue(log.dirty)
+        self.assertEquals(log.flush(), '2011-09-21 02:00:01,854 - basic - INFO - Line 02')
+        other.flush()
+
+        self.watcher.poll([log, other])
+        self.assertFalse(log.dirty)
+        self.assertFalse(other.dirty)
+
+        # Rewinding makes the log dirty, even without changes in file
+        log.rewind(1)
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+
+    def test_log_is_dirty_when_rotated_or_recreated(self):
+        filename = '/tmp/jabber_test/basic.log'
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - basic - INFO - Line 01\n')
+        log = Log(filename)
+        self.watcher.poll([log])
+        log.flush()
+
+        os.rename(filename, filename + '.1')
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+        log.flush()
+
+        self.watcher.poll([log])
+        self.assertFalse(log.dirty)
+
+        open(filename, 'w').write('2011-09-21 03:00:01,854 - basic - INFO - Line 03\n')
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+        self.assertEquals(log.flush(), '2011-09-21 03:00:01,854 - basic - INFO - Line 03')
+
+    def test_symlinked_log_is_dirty_when_its_file_is_modified(self):
+        os.mkdir('/tmp/jabber_test/real')
+        os.mkdir('/tmp/jabber_test/links')
+        filename = '/tmp/jabber_test/real/app.log'
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - app - INFO - Line 01\n')
+        os.symlink(filename, '/tmp/jabber_test/links/app.log')
+        log = Log('/tmp/jabber_test/links/app.log')
+        self.watcher.poll([log])
+        log.flush()
+        self.watcher.poll([log])
+        self.assertFalse(log.dirty)
+
+        open(filename, 'a').write('2011-09-21 02:00:01,854 - app - INFO - Line 02\n')
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+        self.assertEquals(log.flush(), '2011-09-21 02:00:01,854 - app - INFO - Line 02')
+
+        # The link is pointed to another file
+        other = '/tmp/jabber_test/other.log'
+        open(other, 'w').write('2011-09-21 03:00:01,854 - app - INFO - Line 03\n')
+        os.rename('/tmp/jabber_test/links/app.log', '/tmp/jabber_test/links/app.log.1')
+        os.symlink(other, '/tmp/jabber_test/links/app.log')
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+        log.flush()
+        self.watcher.poll([log])
+        self.assertFalse(log.dirty)
+        open(other, 'a').write('2011-09-21 04:00:01,854 - app - INFO - Line 04\n')
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+
+    def test_logs_in_directories_that_cant_be_watched_are_always_dirty(self):
+        log = Log('/tmp/jabber_test/missing/basic.log')
+        log.flush()
+
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+        log.flush()
+        self.watcher.poll([log])
+        self.assertTrue(log.dirty)
+
+class BotWatcherTest(BaseTest):
+
+    def setUp(self):
+        super(BotWatcherTest, self).setUp()
+        fake_logger = fudge.Fake('logger', callable=True).returns_fake().is_a_stub()
+        self.logger_patch = fudge.patch_object(Bot, '_get_logger', fake_logger)
+
+    def tearDown(self):
+        super(BotWatcherTest, self).tearDown()
+        self.logger_patch.restore()
+
+    def test_only_dirty_logs_are_flushed(self):
+        class Watcher(PollingWatcher):
+            def poll(self, logs):
+                pass
+
+        bot = Bot('user@server', 'pass', watcher=Watcher())
+        bot.client = fudge.Fake('client').is_a_stub()
+        filename = '/tmp/jabber_test/first.log'
+        bot.logs['first'] = Log(filename)
+        bot.flush_logs()
+
+        open(filename, 'w').write('2011-09-21 01:00:01,854 - first - INFO - Line 01\n')
+        bot.flush_logs()
+        self.assertTrue(bot.logs['first'].status is None)
+
+        bot.logs['first'].dirty = True
+        bot.flush_logs()
+        self.assertEquals(bot.logs['first'].status.message, 'Line 01')
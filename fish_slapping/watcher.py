@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2011, Luis Henrique Cassis Fagundes <lhfagundes@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Watchers tell which logs have changed, so that only those are flushed.
+# A watcher's poll() receives the logs being monitored and sets log.dirty
+# for the ones that must be flushed.
+
+import os, errno, struct, ctypes, ctypes.util
+
+class PollingWatcher(object):
+    """
+    Marks every log as dirty on every poll. Used when there's no way to be
+    notified of changes.
+    """
+
+    def poll(self, logs):
+        for log in logs:
+            log.dirty = True
+
+    def fileno(self):
+        return None
+
+    def close(self):
+        pass
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+EVENT = struct.Struct('iIII')
+
+class InotifyWatcher(object):
+    """
+    Uses Linux inotify to mark a log as dirty only when its file is modified,
+    moved, created or deleted. Directories are watched instead of files, so
+    that rotated and recreated logs are noticed. Logs whose directory can't
+    be watched are marked as dirty on every poll.
+    """
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        self.paths = {}
+        self.changed = set()
+        self.overflow = False
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def _watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, directory, self.MASK)
+        if wd < 0:
+            return False
+        self.directories[wd] = directory
+        return True
+
+    def _read_events(self):
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return
+                raise
+            if not data:
+                return
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = EVENT.unpack_from(data, pos)
+                name = data[pos + EVENT.size:pos + EVENT.size + length].rstrip('\0')
+                pos += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    self.overflow = True
+                elif mask & IN_IGNORED:
+                    # Directory is gone, it will be watched again if recreated
+                    self.directories.pop(wd, None)
+                elif wd in self.directories:
+                    self.changed.add(os.path.join(self.directories[wd], name))
+
+    def poll(self, logs):
+        self._read_events()
+        watched = set(self.directories.values())
+        for log in logs:
+            paths = self.paths.get(log.logfile)
+            if paths is None or self.overflow or paths[0] in self.changed:
+                # A symlink is watched in its directory and in the directory of
+                # the file it points to, where the file is written
+                path = os.path.abspath(log.logfile)
+                paths = self.paths[log.logfile] = [path]
+                real = os.path.realpath(path)
+                if real != path:
+                    paths.append(real)
+            for path in paths:
+                directory = os.path.dirname(path)
+                if directory not in watched:
+                    # Anything may have happened before it was watched
+                    if self._watch(directory):
+                        watched.add(directory)
+                    log.dirty = True
+                elif self.overflow or path in self.changed:
+                    log.dirty = True
+        self.changed.clear()
+        self.overflow = False
+
+def get_watcher():
+    """
+    Returns an InotifyWatcher if inotify is available, or a PollingWatcher
+    """
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return PollingWatcher()